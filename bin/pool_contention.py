@@ -0,0 +1,165 @@
+"""
+Measures checkout latency and throughput of quma's pool under contention
+and compares it with the previous implementation, which was built on a
+``queue.Queue`` with an ``RLock`` and a separate overflow lock.
+
+Usage: python bin/pool_contention.py [threads] [checkouts] [hold]
+
+Every thread checks out a connection ``checkouts`` times and keeps it
+for ``hold`` seconds. The connections are dummies, so only the overhead
+of the pools is measured.
+"""
+
+import sys
+import threading
+import time
+from queue import Empty, Full
+from queue import Queue as BaseQueue
+
+from quma.pool import Pool
+
+threads = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+loops = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+hold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0001
+SIZE = 8
+
+
+class DummyConnection(object):
+    """Stands in for the provider connection class of a pool"""
+
+    persist = False
+
+    def __init__(self, url, **kwargs):
+        pass
+
+    def get(self, autocommit=False):
+        return object()
+
+    def reset(self, conn):
+        pass
+
+    def enable_autocommit_if(self, autocommit, conn):
+        return conn
+
+    def close(self, conn):
+        pass
+
+
+class Queue(BaseQueue):
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._init(maxsize)
+        self.mutex = threading.RLock()
+        self.not_full = threading.Condition(self.mutex)
+        self.not_empty = threading.Condition(self.mutex)
+        self.all_tasks_done = threading.Condition(self.mutex)
+        self.unfinished_tasks = 0
+
+
+class QueuePool(object):
+    """The core of the previous pool implementation"""
+
+    def __init__(self, conn_class, url, size=5, overflow=10, timeout=None):
+        self._MAX = overflow
+        self._overflow = 0 - size
+        self._timeout = timeout
+        self._overflow_lock = threading.Lock()
+        self._pool = Queue(maxsize=size)
+        self._conn = conn_class(url)
+
+    def _inc_overflow(self):
+        with self._overflow_lock:
+            if self._overflow < self._MAX:
+                self._overflow += 1
+                return True
+
+    def _dec_overflow(self):
+        with self._overflow_lock:
+            self._overflow -= 1
+
+    def put(self, conn):
+        self._conn.reset(conn)
+        try:
+            self._pool.put(conn, False)
+        except Full:
+            self._conn.close(conn)
+            self._dec_overflow()
+
+    def get(self, autocommit=False):
+        try:
+            wait = self._overflow >= self._MAX
+            conn = self._pool.get(wait, self._timeout)
+            return self._conn.enable_autocommit_if(autocommit, conn)
+        except Empty:
+            pass
+        if self._inc_overflow() is True:
+            return self._conn.get(autocommit=autocommit)
+        # The previous implementation raised a TimeoutError here
+        return self.get(autocommit)
+
+
+def run(pool):
+    latencies = [None] * threads
+    start = threading.Barrier(threads + 1)
+
+    def worker(index):
+        timings = []
+        start.wait()
+        for _ in range(loops):
+            begin = time.perf_counter()
+            conn = pool.get()
+            timings.append(time.perf_counter() - begin)
+            if hold:
+                time.sleep(hold)
+            pool.put(conn)
+        latencies[index] = timings
+
+    workers = [
+        threading.Thread(target=worker, args=(i,)) for i in range(threads)
+    ]
+    for w in workers:
+        w.start()
+    start.wait()
+    begin = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - begin
+    timings = sorted(t for timings in latencies for t in timings)
+    return elapsed, timings
+
+
+def report(name, elapsed, timings):
+    def percentile(p):
+        return timings[int(len(timings) * p) - 1] * 1e6
+
+    print(
+        "{:<12} {:>10.0f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            name,
+            len(timings) / elapsed,
+            percentile(0.5),
+            percentile(0.99),
+            timings[-1] * 1e6,
+        )
+    )
+
+
+header = "\n{} threads, {} checkouts each, pool size {}, hold {}s:".format(
+    threads, loops, SIZE, hold
+)
+print(header)
+print("-" * (len(header) - 1))
+print(
+    "{:<12} {:>10} {:>10} {:>10} {:>10}".format(
+        "pool", "ops/s", "p50 us", "p99 us", "max us"
+    )
+)
+pools = (
+    ("queue", QueuePool(DummyConnection, None, size=SIZE, overflow=0)),
+    ("fifo", Pool(DummyConnection, None, size=SIZE, overflow=0)),
+    (
+        "lifo",
+        Pool(DummyConnection, None, size=SIZE, overflow=0, use_lifo=True),
+    ),
+)
+for name, pool in pools:
+    report(name, *run(pool))
@@ -0,0 +1,601 @@
+import asyncio
+import collections
+import re
+from functools import partial
+from importlib import import_module
+from urllib.parse import urlparse
+
+from . import (
+    database,
+    exc,
+)
+from .cursor import RawCursorWrapper
+from .namespace import (
+    CursorNamespace,
+    get_namespace,
+)
+from .script import (
+    CursorScript,
+    Script,
+)
+from .sql import parse
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+# Options of the synchronous providers asyncpg doesn't know
+SYNC_OPTIONS = ("changeling", "pessimistic", "prepare")
+
+
+# Statements starting with these keywords return rows
+ROW_KEYWORDS = ("SELECT", "VALUES", "WITH", "TABLE", "SHOW", "EXPLAIN")
+RETURNING = re.compile(r"\bRETURNING\b", re.I)
+
+
+def returns_rows(sql):
+    """Return ``True`` if ``sql`` is a single statement with a result."""
+    if len(sql.keywords) != 1:
+        return False
+    if sql.keywords[0] in ROW_KEYWORDS:
+        return True
+    return RETURNING.search(sql.content) is not None
+
+
+def rowcount(status):
+    """Return the number of rows from a command status like
+    ``'INSERT 0 5'`` or -1 if it doesn't contain one."""
+    parts = status.split() if status else []
+    if parts and parts[-1].isdigit():
+        return int(parts[-1])
+    return -1
+
+
+class ThreadDriver(object):
+    """
+    Runs a synchronous provider connection in the event loop's default
+    executor. Used for all DBMS without an asyncio driver.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.paramstyle = conn.paramstyle
+        self.has_rowcount = conn.has_rowcount
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def create(self):
+        return await self.run(self.conn.create_conn, **self.conn.dbapi_kwargs)
+
+    async def enable_autocommit_if(self, autocommit, raw):
+        return await self.run(self.conn.enable_autocommit_if, autocommit, raw)
+
+    def _execute(self, raw, content, params):
+        cursor = RawCursorWrapper(self.conn, self.conn.cursor(raw))
+        try:
+            if params is None:
+                cursor.execute(content)
+            else:
+                cursor.execute(content, params)
+            return cursor.fetchall(), cursor.rowcount
+        finally:
+            cursor.close()
+
+    async def execute(self, raw, content, params):
+        """Execute ``content`` and return all rows of the result and
+        the rowcount."""
+        return await self.run(self._execute, raw, content, params)
+
+    async def commit(self, raw):
+        await self.run(raw.commit)
+
+    async def rollback(self, raw):
+        await self.run(raw.rollback)
+
+    async def reset(self, raw):
+        """Roll back and disable autocommit before the connection is
+        used again."""
+        await self.run(self.conn.reset, raw)
+
+    async def close(self, raw):
+        await self.run(raw.close)
+
+
+class AsyncpgConnection(object):
+    def __init__(self, raw):
+        self.raw = raw
+        self.autocommit = False
+        self.transaction = None
+
+
+class AsyncpgDriver(object):
+    """
+    Uses asyncpg for PostgreSQL. Statements are prepared and cached by
+    asyncpg and rows are ``asyncpg.Record`` objects which support access
+    by index and by column name.
+    """
+
+    paramstyle = "pyformat"
+    has_rowcount = True
+
+    def __init__(self, url, kwargs):
+        self.url = url
+        self.kwargs = {
+            key: value
+            for key, value in kwargs.items()
+            if key not in SYNC_OPTIONS
+        }
+
+    async def create(self):
+        raw = await asyncpg.connect(
+            host=self.url.hostname,
+            port=self.url.port,
+            user=self.url.username,
+            password=self.url.password,
+            database=self.url.path[1:],
+            **self.kwargs,
+        )
+        return AsyncpgConnection(raw)
+
+    async def enable_autocommit_if(self, autocommit, conn):
+        conn.autocommit = autocommit
+        return conn
+
+    def _statement(self, sql, params):
+        if not params:
+            # Without parameters a ? is an operator, e. g. jsonb's ?
+            return sql.content, []
+        numbered = sql.numbered(escape=False)
+        if numbered is None:
+            raise ValueError(
+                "asyncpg doesn't support mixed positional "
+                "and named placeholders"
+            )
+        if None in sql.params:
+            return numbered[0], list(params)
+        names = dict.fromkeys(sql.params)
+        return numbered[0], [params[name] for name in names]
+
+    async def execute(self, conn, content, params):
+        sql = parse(content)
+        body, args = self._statement(sql, params)
+        if not conn.autocommit and conn.transaction is None:
+            conn.transaction = conn.raw.transaction()
+            await conn.transaction.start()
+        # fetch() and execute() use asyncpg's statement cache, unlike
+        # prepare(). Only execute() reports the command status, so the
+        # row count of a result is the number of its rows.
+        if not returns_rows(sql):
+            return [], rowcount(await conn.raw.execute(body, *args))
+        rows = await conn.raw.fetch(body, *args)
+        return rows, len(rows)
+
+    async def commit(self, conn):
+        if conn.transaction is not None:
+            transaction, conn.transaction = conn.transaction, None
+            await transaction.commit()
+
+    async def rollback(self, conn):
+        if conn.transaction is not None:
+            transaction, conn.transaction = conn.transaction, None
+            await transaction.rollback()
+
+    async def reset(self, conn):
+        await self.rollback(conn)
+        conn.autocommit = False
+
+    async def close(self, conn):
+        await conn.raw.close()
+
+
+class Connection(object):
+    """
+    Opens a new connection for every cursor or, if ``persist`` is
+    ``True``, shares a single one.
+    """
+
+    def __init__(self, driver, persist=False):
+        self.driver = driver
+        self.persist = persist
+        self.paramstyle = driver.paramstyle
+        self.has_rowcount = driver.has_rowcount
+        self.raw = None
+
+    async def get(self, autocommit=False):
+        if not self.persist:
+            raw = await self.driver.create()
+        elif self.raw is None:
+            raw = self.raw = await self.driver.create()
+        else:
+            raw = self.raw
+        return await self.driver.enable_autocommit_if(autocommit, raw)
+
+    async def put(self, raw):
+        await self.driver.reset(raw)
+        if not self.persist:
+            await self.driver.close(raw)
+
+    async def close(self):
+        if self.raw is not None:
+            raw, self.raw = self.raw, None
+            await self.driver.close(raw)
+
+
+class Pool(object):
+    """
+    An asyncio pool of connections. Waiting for a connection suspends
+    the task instead of blocking the thread.
+
+    :param size: The number of connections kept in the pool.
+    :param overflow: The number of connections which may be opened in
+        addition. ``-1`` means no limit.
+    :param timeout: The number of seconds to wait for a connection.
+    """
+
+    def __init__(self, driver, size=5, overflow=10, timeout=None):
+        self.driver = driver
+        self.paramstyle = driver.paramstyle
+        self.has_rowcount = driver.has_rowcount
+        self.size = size
+        self.overflow = overflow
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._opened = 0
+        self._condition = None
+
+    @property
+    def _available(self):
+        # Created on first use inside the running loop. Before Python
+        # 3.10 a Condition is bound to the loop current at its creation,
+        # which is not the one started later by asyncio.run().
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _can_open(self):
+        if self.overflow == -1:
+            return True
+        return self._opened < self.size + self.overflow
+
+    def _timeout_error(self):
+        return exc.TimeoutError(
+            "Pool limit of size {} overflow {} reached, "
+            "connection timed out, timeout {}".format(
+                self.size, self.overflow, self.timeout
+            )
+        )
+
+    async def _acquire(self):
+        # Returns an idle connection or None if a new one may be opened.
+        # Only the wait is timed, so a connection or slot which has been
+        # taken is never lost to a timeout.
+        loop = asyncio.get_running_loop()
+        deadline = None
+        if self.timeout is not None:
+            deadline = loop.time() + self.timeout
+        async with self._available:
+            while not self._idle and not self._can_open():
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise self._timeout_error()
+                try:
+                    await asyncio.wait_for(self._available.wait(), remaining)
+                except asyncio.TimeoutError:
+                    # Pass on a notification which may have arrived
+                    # together with the timeout
+                    self._available.notify()
+                    raise self._timeout_error() from None
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+            return None
+
+    async def _release_slot(self):
+        async with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    async def get(self, autocommit=False):
+        raw = await self._acquire()
+        if raw is None:
+            try:
+                raw = await self.driver.create()
+            except BaseException:
+                await self._release_slot()
+                raise
+        return await self.driver.enable_autocommit_if(autocommit, raw)
+
+    async def put(self, raw):
+        try:
+            await self.driver.reset(raw)
+        except Exception:
+            await self._release_slot()
+            await self.driver.close(raw)
+            raise
+        async with self._available:
+            if len(self._idle) < self.size:
+                self._idle.append(raw)
+                self._available.notify()
+                return
+        await self._release_slot()
+        await self.driver.close(raw)
+
+    async def close(self):
+        async with self._available:
+            idle, self._idle = self._idle, collections.deque()
+            self._opened -= len(idle)
+        for raw in idle:
+            await self.driver.close(raw)
+
+    @property
+    def checkedin(self):
+        return len(self._idle)
+
+    @property
+    def checkedout(self):
+        return self._opened - len(self._idle)
+
+
+def connect(dburi, **kwargs):
+    """
+    Create and return an asyncio Connection or Pool object specified
+    via ``dburi``. PostgreSQL uses asyncpg if it is installed, all
+    other DBMS run their synchronous driver in threads.
+    """
+    url = urlparse(dburi)
+    provider, _, mode = url.scheme.partition("+")
+    if mode not in ("", "pool"):
+        raise ValueError(
+            'Wrong scheme. Only "provider://" or '
+            '"provider+pool://" are allowed'
+        )
+    pool_kwargs = {
+        key: kwargs.pop(key)
+        for key in ("size", "overflow", "timeout")
+        if key in kwargs
+    }
+    persist = kwargs.pop("persist", False)
+    if provider == "postgresql" and asyncpg is not None:
+        driver = AsyncpgDriver(url, kwargs)
+    else:
+        if provider == "sqlite":
+            # Connections are used by the threads of the executor
+            kwargs.setdefault("check_same_thread", False)
+        module = import_module("quma.provider.{}".format(provider))
+        driver = ThreadDriver(module.Connection(url, **kwargs))
+    if mode == "pool":
+        if persist:
+            raise ValueError("Persistent connections are not allowed")
+        return Pool(driver, **pool_kwargs)
+    return Connection(driver, persist=persist)
+
+
+class Query(object):
+    """
+    The asyncio counterpart of :class:`quma.query.Query`. The whole
+    result is fetched when the query is executed.
+    """
+
+    def __init__(self, script, cursor, args, kwargs, prepare_params):
+        self.script = script
+        self.cursor = cursor
+        self.args = args
+        self.kwargs = kwargs
+        self.prepare_params = prepare_params
+        self._result_cache = None
+        self._rowcount = -1
+
+    async def run(self):
+        """Execute the query."""
+        content, params = self.script.statement(
+            self.cursor, list(self.args), self.kwargs, self.prepare_params
+        )
+        try:
+            rows, rowcount = await self.cursor.conn.driver.execute(
+                self.cursor.raw_conn, content, params
+            )
+        finally:
+            self.script.echo and self.script.mogrify(
+                self.cursor, content, params
+            )
+        self._result_cache = rows
+        if self.cursor.has_rowcount:
+            self._rowcount = rowcount
+        return self
+
+    def __await__(self):
+        return self.run().__await__()
+
+    async def _fetch(self):
+        if self._result_cache is None:
+            await self.run()
+        return self._result_cache
+
+    async def __aiter__(self):
+        for row in await self._fetch():
+            yield row
+
+    async def all(self):
+        """Return a list of all results"""
+        return await self._fetch()
+
+    async def one(self):
+        """Get exactly one row and check if only one exists,
+        otherwise raise an error."""
+        rows = await self._fetch()
+        if len(rows) == 0:
+            raise exc.DoesNotExistError()
+        if len(rows) > 1:
+            raise exc.MultipleRowsError()
+        return rows[0]
+
+    async def value(self, key=0):
+        """Call :func:`one` and return the first column by default."""
+        return (await self.one())[key]
+
+    async def first(self):
+        """Return the first row or None if there is no row."""
+        rows = await self._fetch()
+        return rows[0] if rows else None
+
+    async def exists(self):
+        """Return if the query's result has rows."""
+        return len(await self._fetch()) > 0
+
+    async def count(self):
+        """Return the length of the result."""
+        rows = await self._fetch()
+        if self._rowcount >= 0 and not rows:
+            return self._rowcount
+        return len(rows)
+
+
+class AsyncCursorScript(CursorScript):
+    def __call__(self, *args, prepare_params=None, **kwargs):
+        return Query(self.script, self.cursor, args, kwargs, prepare_params)
+
+
+class AsyncCursorNamespace(CursorNamespace):
+    script_class = AsyncCursorScript
+
+
+class Cursor(object):
+    """
+    The asyncio counterpart of :class:`quma.cursor.Cursor`.
+
+    Scripts are called through the cursor only, e. g.
+    ``await cur.users.all().all()``.
+    """
+
+    def __init__(self, db, contextcommit, autocommit=False):
+        self.db = db
+        self.conn = db.conn
+        self.namespaces = db.namespaces
+        self.contextcommit = contextcommit
+        self.autocommit = autocommit
+        self.carrier = None
+        self.raw_conn = None
+        self.paramstyle = db.conn.paramstyle
+        self.has_rowcount = db.conn.has_rowcount
+
+    async def __aenter__(self):
+        return await self.create_cursor()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.contextcommit and exc_type is None:
+                await self.commit()
+        finally:
+            await self.close()
+
+    async def create_cursor(self, autocommit=None):
+        if autocommit is None:
+            autocommit = self.autocommit
+        self.raw_conn = await self.conn.get(autocommit=autocommit)
+        return self
+
+    async def close(self):
+        """Return the connection."""
+        if self.raw_conn is not None:
+            raw_conn, self.raw_conn = self.raw_conn, None
+            await self.conn.put(raw_conn)
+
+    async def commit(self):
+        await self.conn.driver.commit(self.raw_conn)
+
+    async def rollback(self):
+        await self.conn.driver.rollback(self.raw_conn)
+
+    async def execute(self, content, params=None):
+        """Execute ``content`` and return the rows of its result."""
+        rows, _ = await self.conn.driver.execute(
+            self.raw_conn, content, params
+        )
+        return rows
+
+    def query(self, content, *args, is_template=False, **kwargs):
+        """Creates an ad hoc Query object based on content."""
+        script = Script(
+            content,
+            self.db.echo,
+            is_template,
+            self.db.sqldirs,
+            self.db.prepare_params,
+            templates=self.db.templates,
+        )
+        return Query(script, self, args, kwargs, self.db.prepare_params)
+
+    def __getattr__(self, attr):
+        try:
+            return AsyncCursorNamespace(get_namespace(self, attr), self)
+        except AttributeError as e:
+            raise AttributeError(
+                'Namespace or Root method "{}" not found.'.format(attr)
+            ) from e
+
+
+class DatabaseCallWrapper(object):
+    def __init__(self, database, autocommit):
+        self.database = database
+        self.autocommit = autocommit
+
+    @property
+    def cursor(self):
+        return Cursor(
+            self.database,
+            self.database.contextcommit,
+            autocommit=self.autocommit,
+        )
+
+
+class Database(database.Database):
+    """
+    The asyncio counterpart of :class:`quma.Database`. It takes the
+    same parameters, but the connection and the pool are asyncio
+    native.
+
+    .. code-block:: python
+
+        db = Database('sqlite:////path/to/db.sqlite', sqldirs)
+
+        async with db.cursor as cur:
+            user = await cur.users.by_name(name='User 1').one()
+    """
+
+    def _connect(self, dburi, **kwargs):
+        return connect(dburi, **kwargs)
+
+    def __call__(self, autocommit=False):
+        return DatabaseCallWrapper(self, autocommit=autocommit)
+
+    @property
+    def cursor(self):
+        """Return a cursor which opens a connection when it is used
+        as async context manager."""
+        return Cursor(self, self.contextcommit)
+
+    async def execute(self, query, params=None):
+        """Execute the statements in ``query`` and commit
+        immediately. Returns the rows of the result."""
+        cur = await self.cursor.create_cursor()
+        try:
+            rows = await cur.execute(query, params)
+            await cur.commit()
+        except Exception:
+            await cur.rollback()
+            raise
+        finally:
+            await cur.close()
+        return rows
+
+    async def close(self):
+        """Close all open connections."""
+        if not self.shared:
+            self.registry.close()
+        await self.conn.close()
+        self.conn = None
@@ -0,0 +1,131 @@
+from itertools import chain
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def require_pyarrow():
+    if pyarrow is None:
+        raise ImportError(
+            "To export results to Arrow you need to install pyarrow"
+        )
+
+
+def arrow_type(spec):
+    """Create a pyarrow type from a provider's type specification like
+    ``('int64',)`` or ``('timestamp', 'us')``."""
+    name, *args = spec
+    return getattr(pyarrow, name)(*args)
+
+
+def schema(description, rows, types, keys=None):
+    """Build the schema of a result.
+
+    Types are looked up by ``keys``, by default the ``type_code`` of
+    the cursor's ``description``, in the ``types`` mapping of the
+    provider. If the driver doesn't provide a known type code the type
+    is inferred from the values in ``rows``.
+    """
+    if keys is None:
+        keys = [column[1] for column in description]
+    columns = list(zip(*rows)) if rows else [()] * len(description)
+    fields = []
+    for column, key, values in zip(description, keys, columns):
+        spec = types.get(key)
+        if spec is None:
+            arrow = pyarrow.array(values).type
+        else:
+            arrow = arrow_type(spec)
+        fields.append(pyarrow.field(column[0], arrow))
+    return pyarrow.schema(fields)
+
+
+def record_batch(rows, schema):
+    columns = zip(*rows)
+    return pyarrow.RecordBatch.from_arrays(
+        [
+            pyarrow.array(values, type=field.type)
+            for values, field in zip(columns, schema)
+        ],
+        schema=schema,
+    )
+
+
+def null_columns(indexes, rows):
+    """Return the columns of ``indexes`` which are NULL in all rows."""
+    return [i for i in indexes if all(row[i] is None for row in rows)]
+
+
+def reader(batches, types, type_keys=None):
+    """Return a ``pyarrow.RecordBatchReader`` for an iterator of
+    (cursor, rows) tuples as yielded by ``Query._stream``.
+
+    The first batch must be yielded even if it is empty, as the schema
+    is built from it. ``type_keys`` is called with the cursor and
+    returns the keys of the columns in ``types``.
+
+    Columns of unknown type would be typed ``null`` if they only hold
+    NULLs so far. Batches are therefore read ahead until every such
+    column has a value or the result is exhausted.
+    """
+    require_pyarrow()
+    cursor, rows = next(batches)
+    description = cursor.description or ()
+    if type_keys is None:
+        keys = [column[1] for column in description]
+    else:
+        keys = type_keys(cursor)
+    head = [rows]
+    untyped = [i for i, key in enumerate(keys) if types.get(key) is None]
+    pending = null_columns(untyped, rows)
+    while pending:
+        try:
+            _, rows = next(batches)
+        except StopIteration:
+            break
+        head.append(rows)
+        pending = null_columns(pending, rows)
+    result_schema = schema(
+        description, [row for rows in head for row in rows], types, keys
+    )
+    return pyarrow.RecordBatchReader.from_batches(
+        result_schema,
+        (
+            record_batch(rows, result_schema)
+            for rows in chain(head, (rows for _, rows in batches))
+            if rows
+        ),
+    )
+
+
+def file_format(path, format=None):
+    """Return the file format for ``path``. Files ending with
+    ``.parquet`` are Parquet files, all others Arrow IPC files."""
+    if format is None:
+        format = "parquet" if str(path).endswith(".parquet") else "ipc"
+    if format not in ("parquet", "ipc"):
+        raise ValueError("Unknown Arrow file format: {}".format(format))
+    return format
+
+
+def writer(path, schema, format=None):
+    if file_format(path, format) == "parquet":
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(str(path), schema)
+    import pyarrow.ipc
+
+    return pyarrow.ipc.new_file(str(path), schema)
+
+
+def write(reader, path, format=None):
+    """Write all batches of ``reader`` to ``path`` and return the
+    number of written rows."""
+    count = 0
+    with writer(path, reader.schema, format=format) as w:
+        for batch in reader:
+            w.write_batch(batch)
+            count += batch.num_rows
+    return count
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import mmap
+import os
+import posixpath
+import re
+import struct
+import types
+from itertools import chain
+from pathlib import Path
+
+try:
+    from mako import codegen
+    from mako.lookup import TemplateLookup
+    from mako.template import (
+        ModuleTemplate,
+        Template,
+    )
+except ImportError:
+    Template = None
+    TemplateLookup = object
+
+MAGIC = b"QUMABNDL"
+VERSION = 1
+# magic, format version, length of the JSON index
+HEADER = struct.Struct(">8sII")
+
+
+def source_key(content):
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def mako_magic():
+    if Template is None:
+        return None
+    return codegen.MAGIC_NUMBER
+
+
+class Packer(object):
+    """Collects the content of a bundle.
+
+    Directories are stored relative to ``root``, the directory of the
+    bundle file, and namespaces relative to their directory.
+    """
+
+    def __init__(self, file_ext, tmpl_ext, root="."):
+        self.root = root
+        self.file_ext = file_ext
+        self.tmpl_ext = tmpl_ext
+        self.chunks = []
+        self.size = 0
+        self.dirs = []
+        self.compiled = {}
+        self.includes = {}
+
+    def add(self, text):
+        data = text.encode("utf-8")
+        self.chunks.append(data)
+        ref = [self.size, len(data)]
+        self.size += len(data)
+        return ref
+
+    def add_template(self, content, uri=None):
+        if Template is None:
+            return None
+        return self.add(Template(content, uri=uri).code)
+
+    def add_namespace(self, sqldir, path):
+        module = None
+        init = path / "__init__.py"
+        if init.is_file():
+            module = self.add(init.read_text())
+
+        scripts = {}
+        sqlfiles = chain(
+            sorted(path.glob("*.{}".format(self.file_ext))),
+            sorted(path.glob("*.{}".format(self.tmpl_ext))),
+        )
+        for sqlfile in sqlfiles:
+            content = sqlfile.read_text()
+            is_template = sqlfile.suffix.lower() == "." + self.tmpl_ext
+            if is_template:
+                key = source_key(content)
+                if key not in self.compiled:
+                    self.compiled[key] = self.add_template(content)
+            scripts[sqlfile.name] = [self.add(content), is_template]
+        return {
+            "path": path.relative_to(sqldir).as_posix(),
+            "module": module,
+            "scripts": scripts,
+        }
+
+    def add_sqldir(self, sqldir):
+        namespaces = {"__root__": self.add_namespace(sqldir, sqldir)}
+        for path in sorted(sqldir.iterdir()):
+            if path.is_dir():
+                namespaces[path.name] = self.add_namespace(sqldir, path)
+        relpath = Path(os.path.relpath(str(sqldir), str(self.root)))
+        self.dirs.append(
+            {"path": relpath.as_posix(), "namespaces": namespaces}
+        )
+
+        # Files referenced by <%include>, <%namespace> or <%inherit>.
+        # Like Mako's TemplateLookup the first directory wins.
+        for tmplfile in sorted(sqldir.rglob("*.{}".format(self.tmpl_ext))):
+            uri = tmplfile.relative_to(sqldir).as_posix()
+            if uri not in self.includes:
+                content = tmplfile.read_text()
+                self.includes[uri] = [
+                    self.add(content),
+                    self.add_template(content, uri=uri),
+                ]
+
+    def write(self, path):
+        index = json.dumps(
+            {
+                "file_ext": self.file_ext,
+                "tmpl_ext": self.tmpl_ext,
+                "mako": mako_magic(),
+                "dirs": self.dirs,
+                "compiled": self.compiled,
+                "includes": self.includes,
+            }
+        ).encode("utf-8")
+
+        with open(str(path), "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(index)))
+            f.write(index)
+            for chunk in self.chunks:
+                f.write(chunk)
+
+
+def build(sqldirs, path, file_ext="sql", tmpl_ext="msql"):
+    """Pack the script directories ``sqldirs`` into a single bundle
+    file at ``path``.
+
+    The bundle contains the sources of all scripts and namespace
+    modules, as well as the compiled Python code of all templates if
+    Mako is installed. The directories are stored relative to the
+    bundle file, so both can be moved together.
+    """
+    if isinstance(sqldirs, (str, Path)):
+        sqldirs = [sqldirs]
+    root = os.path.dirname(os.path.abspath(str(path)))
+    packer = Packer(file_ext, tmpl_ext, root=root)
+    for sqldir in sqldirs:
+        packer.add_sqldir(Path(sqldir))
+    packer.write(path)
+
+
+class Bundle(object):
+    """
+    A memory-mapped bundle file created by :func:`build`.
+
+    Only the index is parsed when the bundle is opened. Scripts,
+    namespace modules and templates are decoded on first use.
+    """
+
+    def __init__(self, path):
+        with open(str(path), "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("Not a quma bundle: {}".format(path))
+        if version != VERSION:
+            raise ValueError("Unsupported bundle version {}".format(version))
+        self.base = HEADER.size + length
+        index = json.loads(self.data[HEADER.size : self.base].decode("utf-8"))
+        self.file_ext = index["file_ext"]
+        self.tmpl_ext = index["tmpl_ext"]
+        self.dirs = index["dirs"]
+        # Resolve the stored relative paths against the bundle's location
+        root = os.path.dirname(os.path.abspath(str(path)))
+        for sqldir in self.dirs:
+            sqldir["path"] = os.path.normpath(
+                os.path.join(root, sqldir["path"])
+            )
+            for namespace in sqldir["namespaces"].values():
+                namespace["path"] = str(
+                    Path(sqldir["path"]) / namespace["path"]
+                )
+        self.includes = index["includes"]
+        # Compiled code is only usable with the Mako version which
+        # generated it.
+        if index["mako"] is not None and index["mako"] == mako_magic():
+            self.compiled = index["compiled"]
+        else:
+            self.compiled = {}
+            self.includes = {
+                uri: [ref[0], None] for uri, ref in self.includes.items()
+            }
+        self.scripts = {}
+        for sqldir in self.dirs:
+            for namespace in sqldir["namespaces"].values():
+                self.scripts[namespace["path"]] = namespace["scripts"]
+
+    @property
+    def sqldirs(self):
+        return [sqldir["path"] for sqldir in self.dirs]
+
+    def read(self, ref):
+        offset, length = ref
+        start = self.base + offset
+        return self.data[start : start + length].decode("utf-8")
+
+    def namespaces(self, sqldir):
+        """Return (name, path, module source) for every namespace in the
+        directory at position ``sqldir``."""
+        for name, namespace in self.dirs[sqldir]["namespaces"].items():
+            source = namespace["module"]
+            if source is not None:
+                source = self.read(source)
+            yield name, Path(namespace["path"]), source
+
+    def _module(self, name, code, filename):
+        module = types.ModuleType(name)
+        exec(compile(code, filename, "exec"), module.__dict__)
+        return module
+
+    def module(self, ns, path, source):
+        """Execute the source of a namespace module."""
+        return self._module(
+            "quma.mapping.{}".format(ns), source, str(path / "__init__.py")
+        )
+
+    def _template(self, code, content, lookup):
+        module = self._module(
+            "quma.bundle.{}".format(source_key(content)), code, "<bundle>"
+        )
+        return ModuleTemplate(
+            module, module_source=code, template_source=content, lookup=lookup
+        )
+
+    def template(self, key, content, lookup):
+        """Return the precompiled template of ``content`` or None."""
+        ref = self.compiled.get(key)
+        if ref is None:
+            return None
+        return self._template(self.read(ref), content, lookup)
+
+    def include(self, uri, lookup):
+        source, code = self.includes[uri]
+        content = self.read(source)
+        if code is None:
+            return Template(content, uri=uri, lookup=lookup)
+        return self._template(self.read(code), content, lookup)
+
+    def close(self):
+        self.data.close()
+
+
+class BundleLookup(TemplateLookup):
+    """A TemplateLookup which serves included templates from a bundle
+    before it falls back to the file system."""
+
+    def __init__(self, bundle, **kwargs):
+        super().__init__(**kwargs)
+        self.bundle = bundle
+
+    def get_template(self, uri):
+        key = posixpath.normpath(re.sub(r"^/+", "", uri.replace("\\", "/")))
+        if key not in self.bundle.includes:
+            return super().get_template(uri)
+        with self._mutex:
+            try:
+                return self._collection[uri]
+            except KeyError:
+                template = self.bundle.include(key, self)
+                self._collection[uri] = template
+                return template
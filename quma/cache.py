@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict
+
+
+def script_size(script):
+    # The size of a script's UTF-8 encoded content. Markers for names
+    # which are missing in a directory (None) take no space.
+    if script is None:
+        return 0
+    return len(script.content.encode("utf-8"))
+
+
+class ScriptCache(object):
+    """
+    A size-bounded LRU cache of script objects.
+
+    It is shared by all namespaces of a :class:`quma.Database` which is
+    initialized with ``cache='lazy'``. Scripts are added on first use.
+    :class:`quma.script.TemplateCache` keeps compiled templates in it.
+    Names which are missing in a directory are stored as ``None``.
+    When one of the limits is exceeded the least recently used
+    entries are evicted.
+
+    :param size: The maximum number of entries. ``None`` means no limit.
+    :param max_bytes: The maximum accumulated size of the scripts'
+        UTF-8 encoded content. ``None`` means no limit.
+    """
+
+    def __init__(self, size=None, max_bytes=None):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.scripts = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def __contains__(self, key):
+        return key in self.scripts
+
+    def get(self, key):
+        with self.lock:
+            try:
+                script, _ = self.scripts[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.scripts.move_to_end(key)
+            self.hits += 1
+            return script
+
+    def put(self, key, script, size=None):
+        if size is None:
+            size = script_size(script)
+        with self.lock:
+            if key in self.scripts:
+                self.bytes -= self.scripts.pop(key)[1]
+            self.scripts[key] = (script, size)
+            self.bytes += size
+            self._evict()
+
+    def _evict(self):
+        # The most recently added script is always kept, even if it
+        # alone exceeds max_bytes.
+        while len(self.scripts) > 1 and (
+            (self.size is not None and len(self.scripts) > self.size)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            _, (_, size) = self.scripts.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def remove(self, key):
+        with self.lock:
+            try:
+                self.bytes -= self.scripts.pop(key)[1]
+            except KeyError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.scripts.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Return a dict with the cache's counters."""
+        with self.lock:
+            return {
+                "scripts": len(self.scripts),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class StatementCache(object):
+    """
+    An LRU cache of the server-side prepared statements of a single
+    connection.
+
+    Maps SQL strings to generated statement names. Names are never
+    reused, so a statement which failed to be prepared can't collide
+    with a later attempt. Statements which can't be prepared at all
+    are remembered in ``excluded``.
+
+    :param size: The maximum number of prepared statements.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.statements = OrderedDict()
+        self.excluded = set()
+        self.counter = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.statements)
+
+    def get(self, content):
+        """Return the name of the statement prepared for ``content``
+        or ``None``."""
+        try:
+            name = self.statements[content]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.statements.move_to_end(content)
+        self.hits += 1
+        return name
+
+    def add(self, content):
+        """Register a new statement for ``content``.
+
+        Returns its name and a list of the names of the evicted
+        statements which have to be deallocated.
+        """
+        self.counter += 1
+        name = self.statements[content] = "quma_{}".format(self.counter)
+        evicted = []
+        while len(self.statements) > self.size:
+            _, old = self.statements.popitem(last=False)
+            evicted.append(old)
+            self.evictions += 1
+        return name, evicted
+
+    def remove(self, content):
+        self.statements.pop(content, None)
+
+    def exclude(self, content):
+        self.remove(content)
+        self.excluded.add(content)
+
+    def clear(self):
+        self.statements.clear()
+
+    def stats(self):
+        """Return a dict with the cache's counters."""
+        return {
+            "statements": len(self.statements),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
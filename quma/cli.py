@@ -0,0 +1,30 @@
+import argparse
+
+from . import bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="quma")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    bundle_parser = commands.add_parser(
+        "bundle", help="pack script directories into a single bundle file"
+    )
+    bundle_parser.add_argument(
+        "sqldirs", nargs="+", help="script directories in shadowing order"
+    )
+    bundle_parser.add_argument(
+        "-o", "--output", required=True, help="path of the bundle file"
+    )
+    bundle_parser.add_argument("--file-ext", default="sql")
+    bundle_parser.add_argument("--tmpl-ext", default="msql")
+
+    args = parser.parse_args(argv)
+    if args.command == "bundle":
+        bundle.build(
+            args.sqldirs,
+            args.output,
+            file_ext=args.file_ext,
+            tmpl_ext=args.tmpl_ext,
+        )
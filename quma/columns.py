@@ -0,0 +1,111 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DTYPES = {"q": "int64", "d": "float64"}
+
+
+def typecode(value):
+    """Return the array typecode for ``value`` or None if it can't
+    be stored in an array."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return "q"
+    if isinstance(value, float):
+        return "d"
+    return None
+
+
+class Column(object):
+    """
+    Collects the values of a result column.
+
+    Integers and floats are stored in an ``array.array``, which is
+    chosen by the first value. If a later value does not fit, integer
+    columns are widened to floats and everything else falls back to a
+    list.
+    """
+
+    def __init__(self):
+        self.data = None
+
+    def extend(self, values):
+        if not values:
+            return
+        if self.data is None:
+            code = typecode(values[0])
+            self.data = array(code) if code else []
+        if isinstance(self.data, list):
+            self.data.extend(values)
+            return
+        try:
+            # Converting first keeps the column unchanged on failure
+            self.data.extend(array(self.data.typecode, values))
+        except TypeError:
+            self._widen(values)
+        except OverflowError:
+            # Integers larger than 64 bits
+            self._fallback(values)
+
+    def _widen(self, values):
+        if self.data.typecode == "q":
+            try:
+                data = array("d", values)
+            except (TypeError, OverflowError):
+                pass
+            else:
+                self.data = array("d", self.data)
+                self.data.extend(data)
+                return
+        self._fallback(values)
+
+    def _fallback(self, values):
+        self.data = self.data.tolist()
+        self.data.extend(values)
+
+    def result(self, use_numpy=False):
+        data = [] if self.data is None else self.data
+        if not use_numpy:
+            return data
+        if isinstance(data, array):
+            return numpy.frombuffer(data, dtype=DTYPES[data.typecode])
+        return numpy.array(data)
+
+
+def use_numpy(value):
+    if value is None:
+        return numpy is not None
+    if value and numpy is None:
+        raise ImportError("To get NumPy arrays you need to install NumPy")
+    return value
+
+
+class Columns(object):
+    """
+    Collects the rows of a result column by column.
+
+    :param description: The ``description`` attribute of the cursor.
+    :param numpy: Return NumPy arrays if ``True``, ``array.array`` or
+        ``list`` objects if ``False``. If ``None`` NumPy is used if it
+        is installed.
+    """
+
+    def __init__(self, description, numpy=None):
+        self.names = [column[0] for column in description or ()]
+        self.columns = [Column() for _ in self.names]
+        self.numpy = use_numpy(numpy)
+
+    def extend(self, rows):
+        for i, column in enumerate(self.columns):
+            column.extend([row[i] for row in rows])
+
+    def result(self):
+        """Return a dict mapping the column names to their values."""
+        return {
+            name: column.result(self.numpy)
+            for name, column in zip(self.names, self.columns)
+        }
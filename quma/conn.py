@@ -1,3 +1,6 @@
+import threading
+import time
+
 from . import exc
 
 
@@ -17,22 +20,64 @@ class Connection(object):
         self.changeling = kwargs.pop("changeling", False)
         self.persist = kwargs.pop("persist", False)
         self.pessimistic = kwargs.pop("pessimistic", False)
+        self.check_interval = kwargs.pop("check_interval", 0.5)
+        self.query_interval = kwargs.pop("query_interval", 30.0)
+        self.checks = {"skipped": 0, "pinged": 0, "queried": 0}
+        self._checks_lock = threading.Lock()
+        self.returned = None
         self.has_rowcount = True
+        # If count() may let the server count the rows of a query by
+        # wrapping it in a subquery
+        self.count_subquery = True
+        self.paramstyle = "pyformat"
+        # Maps the type codes of the driver's cursor description to
+        # pyarrow types (see quma.arrow)
+        self.arrow_types = {}
         self.dbapi_kwargs = kwargs
 
     def _init_conn(self):
         if self.persist:
             self.conn = self.create_conn(**self.dbapi_kwargs)
+            self.returned = time.monotonic()
 
     def cursor(self, conn):
         return conn.cursor()
 
+    def stream_cursor(self, conn, plain=False):
+        """Return a cursor which doesn't load the whole result into
+        memory. Drivers which don't buffer results use a regular one.
+
+        If ``plain`` is ``True`` the cursor should return tuples
+        instead of row objects."""
+        return self.cursor(conn)
+
     def get_cursor_attr(self, cursor, key):
         return getattr(cursor, key)
 
+    def arrow_type_keys(self, cursor):
+        """Return the keys of the result's columns in ``arrow_types``,
+        by default the type codes of the cursor's description."""
+        return [column[1] for column in cursor.description or ()]
+
     def create_conn(self):
         raise NotImplementedError
 
+    def execute_batch(self, cursor, statements):
+        """Execute a list of (content, params) tuples and return the
+        rows and the rowcount of each. Drivers which can't send several
+        statements at once execute them one after another."""
+        results = []
+        for content, params in statements:
+            cursor.execute(content, params)
+            results.append((cursor.fetchall(), cursor.rowcount))
+        return results
+
+    def copy_in(self, cursor, table, rows, columns=None):
+        raise exc.APIError("COPY is only supported by PostgreSQL")
+
+    def copy_out(self, cursor, content, params, sink, options=None):
+        raise exc.APIError("COPY is only supported by PostgreSQL")
+
     def enable_autocommit_if(self, autocommit, conn):
         raise NotImplementedError
 
@@ -43,7 +88,7 @@ class Connection(object):
         if self.persist:
             if self.pessimistic:
                 try:
-                    self.check()
+                    self.verify(self.conn, self.idle())
                 except exc.OperationalError:
                     self.conn = self.create_conn(**self.dbapi_kwargs)
             return self.enable_autocommit_if(autocommit, self.conn)
@@ -51,11 +96,25 @@ class Connection(object):
             autocommit, self.create_conn(**self.dbapi_kwargs)
         )
 
-    def put(self, conn):
-        conn.rollback()
+    def in_transaction(self, conn):
+        """Return ``False`` if ``conn`` certainly has no open
+        transaction. Drivers which can't tell return ``True``."""
+        return True
+
+    def reset(self, conn):
+        """Roll back an open transaction and disable autocommit so
+        that ``conn`` can be used again. Both are skipped if they aren't
+        needed, as each may cost a round trip."""
+        if self.in_transaction(conn):
+            conn.rollback()
         self.disable_autocommit(conn)
+
+    def put(self, conn):
+        self.reset(conn)
         if not self.persist:
             conn.close()
+            return
+        self.returned = time.monotonic()
 
     def close(self, conn=None):
         if conn:
@@ -73,6 +132,51 @@ class Connection(object):
     def _check(self, conn):
         raise NotImplementedError
 
+    def _ping(self, conn):
+        """Cheaply test if ``conn`` is still usable, e. g. with a signal
+        of the driver that doesn't need a query. Raises
+        ``exc.OperationalError`` if it isn't."""
+        self._check(conn)
+
+    def idle(self):
+        """Return the number of seconds since the persistent connection
+        was returned."""
+        if self.returned is None:
+            return None
+        return time.monotonic() - self.returned
+
+    def verify(self, conn, idle=None):
+        """Test that ``conn`` is still usable after being idle for
+        ``idle`` seconds (``None`` if unknown).
+
+        Connections idle for less than ``check_interval`` seconds are
+        not tested at all and those idle for less than
+        ``query_interval`` only with :meth:`_ping`. All others are
+        tested with a query. Raises ``exc.OperationalError`` if the
+        connection is broken.
+        """
+        if idle is None or idle >= self.query_interval:
+            kind = "queried"
+        elif idle >= self.check_interval:
+            kind = "pinged"
+        else:
+            kind = "skipped"
+        with self._checks_lock:
+            self.checks[kind] += 1
+        if kind == "queried":
+            self.check(conn)
+        elif kind == "pinged":
+            self._ping(conn)
+
+    @property
+    def check_rate(self):
+        """The fraction of verified connections which were actually
+        tested by a ping or a query."""
+        total = sum(self.checks.values())
+        if not total:
+            return 0.0
+        return (total - self.checks["skipped"]) / total
+
     def check(self, conn=None):
         if conn:
             self._check(conn)
@@ -2,8 +2,41 @@ from .namespace import (
     CursorNamespace,
     get_namespace,
 )
-from .query import Query
-from .script import Script
+from .query import (
+    Batch,
+    Query,
+)
+from .script import (
+    CursorScript,
+    Script,
+)
+
+# Wraps a query to copy its result
+COPY_OUT = "COPY (\n{}\n) TO STDOUT"
+
+
+class CursorMethod(object):
+    """
+    A method of :class:`Cursor` which gives way to a namespace or root
+    script of the same name, so that adding methods to the cursor
+    doesn't hide existing scripts.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.__doc__ = method.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, cursor, owner=None):
+        if cursor is None:
+            return self
+        try:
+            namespace = get_namespace(cursor, self.name)
+        except (AttributeError, KeyError):
+            return self.method.__get__(cursor, owner)
+        return CursorNamespace(namespace, cursor)
 
 
 class CarriedConnection(object):
@@ -17,6 +50,8 @@ class RawCursorWrapper(object):
         self.conn = conn
         self.cursor = raw_cursor
         self.has_rowcount = conn.has_rowcount
+        self.count_subquery = conn.count_subquery
+        self.paramstyle = conn.paramstyle
 
     def __getattr__(self, key):
         return self.conn.get_cursor_attr(self.cursor, key)
@@ -86,6 +121,29 @@ class Cursor(object):
     def close(self):
         self.put(force=True)
 
+    def _streaming(self, plain=False):
+        """
+        Return a new cursor which uses a server-side raw cursor
+        on the same connection. If ``plain`` is ``True`` it returns
+        tuples instead of row objects.
+
+        Only the raw cursor of the copy has to be closed.
+        """
+        cursor = Cursor(
+            self.db,
+            self.namespaces,
+            False,
+            carrier=self.carrier,
+            autocommit=self.autocommit,
+        )
+        cursor.raw_conn = self.raw_conn
+        cursor.raw_cursor = RawCursorWrapper(
+            self.conn, self.conn.stream_cursor(self.raw_conn, plain=plain)
+        )
+        return cursor
+
+    streaming = CursorMethod(_streaming)
+
     def commit(self):
         self.raw_conn.commit()
 
@@ -102,9 +160,59 @@ class Cursor(object):
             is_template,
             self.db.sqldirs,
             self.db.prepare_params,
+            templates=self.db.templates,
         )
         return Query(script, self, args, kwargs, self.db.prepare_params)
 
+    @CursorMethod
+    def batch(self):
+        """
+        Return a :class:`quma.query.Batch` which executes the queries
+        added to it together when its context ends.
+        """
+        return Batch(self)
+
+    @CursorMethod
+    def copy_in(self, table, rows, columns=None):
+        """
+        Load ``rows``, an iterable of sequences or row objects, into
+        ``table`` using PostgreSQL's ``COPY FROM``. The rows are
+        serialized while they are sent. Rows which are mappings, e. g.
+        dicts, require ``columns``. Returns the number of rows.
+        """
+        return self.conn.copy_in(
+            self.raw_cursor.cursor, table, rows, columns=columns
+        )
+
+    @CursorMethod
+    def copy_out(self, query, sink, options=None):
+        """
+        Write the result of ``query`` to the file-like object ``sink``
+        using PostgreSQL's ``COPY TO``. ``query`` can be a
+        :class:`Query`, a script or a SQL string. ``options`` are
+        passed to ``COPY``, e. g. ``'FORMAT csv, HEADER'``. Returns the
+        number of rows.
+        """
+        if isinstance(query, str):
+            query = self.query(query)
+        elif isinstance(query, CursorScript):
+            query = query()
+        elif isinstance(query, Script):
+            query = query(self)
+        statement = query.script.statement(
+            query.cursor,
+            list(query.args),
+            query.kwargs,
+            query.prepare_params,
+            wrapper=COPY_OUT,
+        )
+        if statement is None:
+            raise ValueError("Only SELECT and VALUES statements can be copied")
+        content, params = statement
+        return self.conn.copy_out(
+            self.raw_cursor.cursor, content, params, sink, options=options
+        )
+
     def get_conn_attr(self, attr):
         return getattr(self.raw_conn, attr)
 
@@ -1,18 +1,14 @@
-import importlib.util
 import threading
 from importlib import import_module
-from pathlib import Path
 from urllib.parse import urlparse
 
 from . import (
     exc,
     pool,
+    registry,
 )
 from .cursor import Cursor
-from .namespace import (
-    Namespace,
-    get_namespace,
-)
+from .namespace import get_namespace
 from .script import Script
 
 
@@ -98,6 +94,11 @@ class Database(object):
         of each connection pool checkout (see section "Connection Pool"), to
         test that the database connection is still viable. Defaults to
         ``False``.
+    :param check_interval: The number of seconds a connection must be idle
+        before ``pessimistic`` tests it. Defaults to 0.5.
+    :param query_interval: The number of seconds a connection must be idle
+        before ``pessimistic`` tests it with a query instead of a cheap
+        driver signal. Defaults to 30.
     :param contextcommit: If ``True`` and a context manager is used quma will
         automatically commit all changes when the context manager exits.
         Defaults to ``False``.
@@ -114,6 +115,31 @@ class Database(object):
         query without substitutions.
     :param cache: cache the scripts in memory if ``True``,
         otherwise re-read each script when the query is executed.
+        If ``'lazy'`` scripts are read on first use and kept in a
+        size-bounded LRU cache (see ``cache_size`` and ``cache_bytes``).
+        Defaults to ``False``.
+    :param cache_size: The maximum number of entries held by the lazy
+        cache. Defaults to ``None`` (no limit).
+    :param cache_bytes: The maximum accumulated size in bytes of the
+        UTF-8 encoded scripts held by the lazy cache. Defaults to
+        ``None`` (no limit).
+    :param bundle: Path to a bundle file created with ``quma bundle``
+        (see :doc:`Script caching <caching>`). If given, scripts and
+        namespaces are loaded from the bundle instead of ``sqldirs``.
+        Defaults to ``None``.
+    :param watch: If ``True`` (requires ``cache=True``) a background
+        thread watches the script directories and reloads scripts which
+        were added, changed or removed. Defaults to ``False``.
+    :param watch_interval: The number of seconds between two checks if
+        quma needs to poll for changes. Defaults to ``1.0``.
+    :param template_module_dir: A directory where the compiled
+        :doc:`templates <templates>` are stored as Python modules. They
+        are reused by other processes and after restarts. If ``None``
+        compiled templates are only kept in memory. Defaults to ``None``.
+    :param shared: If ``True`` the namespaces and scripts are shared with
+        all other instances created with the same script related
+        parameters (``sqldirs``, ``file_ext``, ``cache``, ``echo`` and so
+        on). Only the connection is specific to the instance.
         Defaults to ``False``.
 
     Additional connection pool parameters (see :doc:`Connection pool <pool>`):
@@ -127,6 +153,21 @@ class Database(object):
         to indicate no overflow limit. Defaults to 10.
     :param timeout: The number of seconds to wait before giving
         up on returning a connection. Defaults to None.
+    :param min_idle: The number of idle connections a background thread
+        keeps in the pool, up to ``size``. Defaults to 0.
+    :param prewarm: If ``True`` ``min_idle`` connections, or ``size`` if
+        it is 0, are opened in parallel when the pool is created. If
+        ``'background'`` they are opened without waiting. Defaults to
+        ``False``.
+    :param max_lifetime: The number of seconds after which a connection is
+        closed and replaced, shortened by a random jitter of up to 10%.
+        Defaults to None.
+    :param idle_timeout: The number of seconds after which an idle
+        connection is closed, as long as more than ``min_idle``
+        connections are idle. Defaults to None.
+    :param use_lifo: If ``True`` the pool hands out the most recently
+        returned connection first instead of the longest idle one.
+        Defaults to ``False``.
     """
 
     DoesNotExistError = exc.DoesNotExistError
@@ -141,69 +182,67 @@ class Database(object):
         else:
             self.sqldirs = kwargs.pop("sqldirs", [])
 
-        self.file_ext = kwargs.pop("file_ext", "sql")
-        self.tmpl_ext = kwargs.pop("tmpl_ext", "msql")
-        self.script_factory = kwargs.pop("script_factory", Script)
-        self.prepare_params = kwargs.pop("prepare_params", None)
         self.contextcommit = kwargs.pop("contextcommit", False)
-        self.echo = kwargs.pop("echo", False)
-        self.cache = kwargs.pop("cache", False)
+        self.shared = kwargs.pop("shared", False)
+        self.registry = registry.get(
+            self.shared,
+            db=None if self.shared else self,
+            sqldirs=self.sqldirs,
+            file_ext=kwargs.pop("file_ext", None),
+            tmpl_ext=kwargs.pop("tmpl_ext", None),
+            script_factory=kwargs.pop("script_factory", Script),
+            prepare_params=kwargs.pop("prepare_params", None),
+            echo=kwargs.pop("echo", False),
+            cache=kwargs.pop("cache", False),
+            cache_size=kwargs.pop("cache_size", None),
+            cache_bytes=kwargs.pop("cache_bytes", None),
+            bundle=kwargs.pop("bundle", None),
+            watch=kwargs.pop("watch", False),
+            watch_interval=kwargs.pop("watch_interval", 1.0),
+            template_module_dir=kwargs.pop("template_module_dir", None),
+        )
+        self.sqldirs = self.registry.sqldirs
+        self.file_ext = self.registry.file_ext
+        self.tmpl_ext = self.registry.tmpl_ext
+        self.script_factory = self.registry.script_factory
+        self.prepare_params = self.registry.prepare_params
+        self.echo = self.registry.echo
+        self.cache = self.registry.cache
+        self.namespaces = self.registry.namespaces
+        self.templates = self.registry.templates
+        self.script_cache = self.registry.script_cache
+        self.bundle = self.registry.bundle
+        self.watch = self.registry.watch
+        if self.registry.db is self:
+            # Namespaces of a registry of its own get this instance as
+            # their db. A shared registry is passed to them instead.
+            self.registry.load()
 
         # The remaining kwargs are passed to the DBAPI connect call
-        self.conn = connect(dburi, **kwargs)
+        self.conn = self._connect(dburi, **kwargs)
 
         self.heap = CarrierHeap()
-        self.namespaces = {}
 
-        try:
-            # A single directory
-            if issubclass(type(self.sqldirs), Path):
-                self.sqldirs = str(self.sqldirs)
-            self.register_namespace(self.sqldirs)
-        except TypeError:
-            # A list/collection of directories
-            for sqldir in self.sqldirs:
-                self.register_namespace(sqldir)
+    def _connect(self, dburi, **kwargs):
+        return connect(dburi, **kwargs)
 
     def __call__(self, carrier=None, autocommit=False):
         return DatabaseCallWrapper(
             self, carrier=carrier, autocommit=autocommit
         )
 
+    @property
+    def watcher(self):
+        return self.registry.watcher
+
     def register_namespace(self, sqldir):
-        def instantiate(ns, ns_class, path):
-            if ns in self.namespaces:
-                # pass the old namespace to the new instance
-                shadow = self.namespaces[ns]
-                self.namespaces[ns] = ns_class(self, path, shadow=shadow)
-            else:
-                self.namespaces[ns] = ns_class(self, path)
-
-        def register(path, ns):
-            try:
-                mod_path = str(path / "__init__.py")
-                mod_name = "quma.mapping.{}".format(ns)
-                spec = importlib.util.spec_from_file_location(
-                    mod_name, mod_path
-                )
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                if ns == "__root__":
-                    class_name = "Root"
-                else:
-                    # snake_case to CamelCase
-                    class_name = "".join([s.title() for s in ns.split("_")])
-                ns_class = getattr(module, class_name)
-                if hasattr(ns_class, "alias"):
-                    instantiate(ns_class.alias, ns_class, path)
-                instantiate(ns, ns_class, path)
-            except (AttributeError, FileNotFoundError):
-                instantiate(ns, Namespace, path)
-
-        register(Path(sqldir), "__root__")
-        for path in Path(sqldir).iterdir():
-            if path.is_dir():
-                register(path, path.name)
+        if self.shared:
+            raise ValueError(
+                "Namespaces can't be registered with a shared registry"
+            )
+        self.registry.register_namespace(sqldir)
+        if self.cache is True:
+            self.registry.resolve()
 
     def execute(self, query, **kwargs):
         """Execute the statements in ``query`` and commit
@@ -227,6 +266,8 @@ class Database(object):
         """Close (all) open connections. If you want to reconnect you
         need to create a new :class:`quma.Database` instance.
         """
+        if not self.shared:
+            self.registry.close()
         self.conn.close()
         self.conn = None
 
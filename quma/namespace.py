@@ -10,78 +10,228 @@ from .script import (
 
 
 def get_namespace(self, attr):
-    if attr in self.namespaces:
+    try:
         return self.namespaces[attr]
+    except KeyError:
+        pass
+    # The root namespace falls back to its shadows itself
+    return getattr(self.namespaces["__root__"], attr)
 
-    root = self.namespaces["__root__"]
-    while root:
-        try:
-            return getattr(root, attr)
-        except AttributeError:
-            root = root.shadow
-    raise AttributeError
+
+class BundledScript(object):
+    """Placeholder for a bundled script in a resolution table which
+    is created on first access."""
+
+    def __init__(self, namespace, attr):
+        self.namespace = namespace
+        self.attr = attr
+
+    def load(self):
+        return self.namespace._bundled_script(self.attr)
 
 
 class Namespace(object):
     def __init__(self, db, sqldir, shadow=None):
+        self._resolved = None
         self.db = db
         self.sqldir = sqldir
         self.cache = db.cache
         self.echo = db.echo
         self.shadow = shadow
         self._scripts = {}
-        if db.cache:
-            self._collect_scripts(sqldir)
-
-    def _collect_scripts(self, sqldir):
-        sqlfiles = chain(
+        self._stats = {}
+        self._missing = (None, set())
+        self._bundled = None
+        if db.bundle is not None:
+            self._bundled = {
+                self._script_attr(name): entry
+                for name, entry in db.bundle.scripts[str(sqldir)].items()
+            }
+        elif db.cache and db.cache != "lazy":
+            if db.watch:
+                self._reload()
+            else:
+                self._collect_scripts(sqldir)
+
+    def _script_files(self, sqldir):
+        return chain(
             sqldir.glob("*.{}".format(self.db.file_ext)),
             sqldir.glob("*.{}".format(self.db.tmpl_ext)),
         )
 
-        for sqlfile in sqlfiles:
-            filename = Path(sqlfile.name)
-            attr = filename.stem
-            ext = filename.suffix
-
-            if hasattr(self, attr):
-                # We have real namespace method which shadows
-                # this file
-                attr = "_" + attr
-
-            with open(str(sqlfile), "r") as f:
-                self._scripts[attr] = self.db.script_factory(
-                    f.read(),
-                    self.echo,
-                    ext.lower() == "." + self.db.tmpl_ext,
-                    self.db.sqldirs,
-                    prepare_params=self.db.prepare_params,
-                )
+    def _script_attr(self, filename):
+        attr = Path(filename).stem
+        if hasattr(type(self), attr):
+            # We have real namespace method which shadows
+            # this file
+            attr = "_" + attr
+        return attr
+
+    def _create_script(self, content, is_template):
+        return self.db.script_factory(
+            content,
+            self.echo,
+            is_template,
+            self.db.sqldirs,
+            prepare_params=self.db.prepare_params,
+            templates=self.db.templates,
+        )
+
+    def _read_script(self, sqlfile):
+        with open(str(sqlfile), "r") as f:
+            return self._create_script(
+                f.read(), sqlfile.suffix.lower() == "." + self.db.tmpl_ext
+            )
+
+    def _collect_scripts(self, sqldir):
+        for sqlfile in self._script_files(sqldir):
+            attr = self._script_attr(sqlfile.name)
+            self._scripts[attr] = self._read_script(sqlfile)
+
+    def _reload(self):
+        """Re-read added or modified scripts and drop removed ones.
+
+        The scripts of the namespace are replaced at once, so concurrent
+        lookups see either the old or the new set of scripts.
+        Returns ``True`` if anything changed.
+        """
+        # The size catches changes within the resolution of the mtime
+        stats = {}
+        for sqlfile in self._script_files(self.sqldir):
+            try:
+                stat = sqlfile.stat()
+            except FileNotFoundError:
+                continue
+            stats[sqlfile] = (stat.st_mtime_ns, stat.st_size)
+        if stats == self._stats:
+            return False
+
+        scripts = {}
+        for sqlfile, stat in stats.items():
+            attr = self._script_attr(sqlfile.name)
+            if self._stats.get(sqlfile) == stat and attr in self._scripts:
+                scripts[attr] = self._scripts[attr]
+                continue
+            try:
+                scripts[attr] = self._read_script(sqlfile)
+            except FileNotFoundError:
+                pass
+        self._stats = stats
+        self._scripts = scripts
+        return True
+
+    def _members(self):
+        # Attributes of custom namespace classes, bound to this instance
+        members = {}
+        for cls in reversed(type(self).__mro__):
+            if cls is Namespace or not issubclass(cls, Namespace):
+                continue
+            for name in vars(cls):
+                if not name.startswith("__"):
+                    members[name] = getattr(self, name)
+        return members
+
+    def _resolve(self):
+        """Precompute a table of all scripts and methods which are
+        reachable through this namespace including its shadows.
+
+        Requires that the shadow has already been resolved. Only
+        namespaces with a fixed set of scripts can be resolved, i. e.
+        if ``cache`` is ``True`` or scripts are loaded from a bundle.
+        """
+        resolved = {}
+        if self.shadow is not None:
+            resolved.update(self.shadow._resolved)
+            resolved.update(self.shadow._members())
+        if self._bundled is not None:
+            for attr in self._bundled:
+                resolved[attr] = BundledScript(self, attr)
+        resolved.update(self._scripts)
+        self._resolved = resolved
+
+    def _find_script(self, attr):
+        sqlfile = self.sqldir / ".".join((attr, self.db.file_ext))
+        if not sqlfile.is_file():
+            sqlfile = self.sqldir / ".".join((attr, self.db.tmpl_ext))
+        return self._read_script(sqlfile)
+
+    def _dir_mtime(self):
+        try:
+            return self.sqldir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_script(self, attr):
+        # Names which are known to be missing are only looked up
+        # again if the directory has changed since.
+        mtime, missing = self._missing
+        if attr in missing and self._dir_mtime() == mtime:
+            raise FileNotFoundError(attr)
+        try:
+            return self._find_script(attr)
+        except FileNotFoundError:
+            pass
+        # Read the directory's mtime before looking again. Otherwise a
+        # file created in between could be recorded as missing.
+        current = self._dir_mtime()
+        try:
+            return self._find_script(attr)
+        except FileNotFoundError:
+            if current == mtime:
+                missing.add(attr)
+            else:
+                self._missing = (current, {attr})
+            raise
+
+    def _bundled_script(self, attr):
+        try:
+            return self._scripts[attr]
+        except KeyError:
+            pass
+        source, is_template = self._bundled[attr]
+        script = self._create_script(self.db.bundle.read(source), is_template)
+        self._scripts[attr] = script
+        return script
 
     def __getattr__(self, attr):
-        if self.cache:
+        # Namespaces with cached or bundled scripts are resolved
+        # by the registry
+        resolved = self._resolved
+        if resolved is not None:
+            try:
+                obj = resolved[attr]
+            except KeyError:
+                raise AttributeError(attr) from None
+            if type(obj) is BundledScript:
+                obj = resolved[attr] = obj.load()
+            return obj
+
+        if self.cache == "lazy":
+            key = (self.sqldir, attr)
             try:
-                return self._scripts[attr]
+                script = self.db.script_cache.get(key)
             except KeyError:
+                try:
+                    script = self._find_script(attr)
+                except FileNotFoundError:
+                    # Remember the miss, so that a shadowing directory
+                    # doesn't look for the file again.
+                    script = None
+                self.db.script_cache.put(key, script)
+            if script is None:
                 return getattr(self.shadow, attr)
+            return script
 
         try:
-            sqlfile = self.sqldir / ".".join((attr, self.db.file_ext))
-            if not sqlfile.is_file():
-                sqlfile = self.sqldir / ".".join((attr, self.db.tmpl_ext))
-            with open(str(sqlfile), "r") as f:
-                return self.db.script_factory(
-                    f.read(),
-                    self.echo,
-                    Path(sqlfile).suffix == "." + self.db.tmpl_ext,
-                    self.db.sqldirs,
-                    prepare_params=self.db.prepare_params,
-                )
+            return self._load_script(attr)
         except FileNotFoundError:
             return getattr(self.shadow, attr)
 
 
 class CursorNamespace(object):
+    # Wraps the scripts of the namespace
+    script_class = CursorScript
+
     def __init__(self, namespace, cursor):
         self.namespace = namespace
         self.cursor = cursor
@@ -89,7 +239,7 @@ class CursorNamespace(object):
     def __getattr__(self, attr):
         attr_obj = getattr(self.namespace, attr)
         if isinstance(attr_obj, Script):
-            return CursorScript(attr_obj, self.cursor)
+            return self.script_class(attr_obj, self.cursor)
         if isinstance(attr_obj, types.MethodType):
             return partial(attr_obj, self.cursor)
         return attr_obj
@@ -2,136 +2,425 @@
 # pool module and is copyrighted by Michael Bayer under the terms of the
 # MIT license. https://www.sqlalchemy.org/
 
+import random
 import threading
-from queue import (
-    Empty,
-    Full,
-)
-from queue import Queue as BaseQueue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from .exc import (
     OperationalError,
     TimeoutError,
 )
 
+# Fraction of ``max_lifetime`` by which the lifetime of a connection
+# is randomly shortened, so that connections opened at the same time
+# don't expire all at once.
+LIFETIME_JITTER = 0.1
+
+# Upper bound in seconds for the interval between two reaper runs
+MAX_REAP_INTERVAL = 30.0
+
 
-class Queue(BaseQueue):
+class Maintainer(object):
     """
-    Create a queue object with a given maximum size.
+    Keeps at least ``min_idle`` connections in the pool and closes idle
+    connections which exceeded their lifetime or idle timeout.
 
-    If maxsize is <= 0, the queue size is infinite.
+    The thread is woken up whenever fewer than ``min_idle`` connections
+    are left after a connection is checked out or discarded and, if
+    ``reap_interval`` is given, every ``reap_interval`` seconds. If
+    opening a connection fails it is tried again after ``interval``
+    seconds.
     """
 
-    def __init__(self, maxsize=0):
-        """Overrides BaseQueue.__init__ to use a RLock instead of Lock"""
+    def __init__(self, pool, interval=1.0, reap_interval=None):
+        self.pool = pool
+        self.interval = interval
+        self.reap_interval = reap_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="quma-pool-maintainer", daemon=True
+        )
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
 
-        self.maxsize = maxsize
-        self._init(maxsize)
-        self.mutex = threading.RLock()
-        self.not_full = threading.Condition(self.mutex)
-        self.not_empty = threading.Condition(self.mutex)
-        self.all_tasks_done = threading.Condition(self.mutex)
-        self.unfinished_tasks = 0
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.pool.reap()
+                self.pool.fill()
+            except Exception:
+                # The DBMS may not be reachable. Try again later.
+                self._stop.wait(self.interval)
+                continue
+            self._wakeup.wait(self.reap_interval)
+            self._wakeup.clear()
+
+
+class Waiter(object):
+    """
+    A thread waiting for a connection of an exhausted pool.
+
+    ``conn`` is the connection handed over by the pool or ``None`` if
+    the waiter may open a new connection in place of a discarded one.
+    A plain lock, acquired up front, is cheaper than an ``Event``.
+    """
+
+    __slots__ = ("lock", "conn")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lock.acquire()
+        self.conn = None
+
+    def wait(self, timeout=None):
+        return self.lock.acquire(timeout=-1 if timeout is None else timeout)
+
+    def wake(self, conn=None):
+        self.conn = conn
+        self.lock.release()
 
 
 class Pool(object):
-    """A queuing pool of connections"""
+    """
+    A pool of connections.
+
+    The state of the pool is guarded by a single lock which is never
+    held while connections are opened, tested or closed. Idle
+    connections are taken in the order they were returned (FIFO) or, if
+    ``use_lifo`` is ``True``, the most recently returned first (LIFO).
+    Threads waiting for a connection are served in the order of their
+    arrival.
+    """
 
     def __init__(self, conn_class, url, **kwargs):
         size = kwargs.pop("size", 5)
+        self._size = size
         self._MAX = kwargs.pop("overflow", 10)
         self._overflow = 0 - size
         self._timeout = kwargs.pop("timeout", None)
-        self._overflow_lock = threading.Lock()
-        self._pool = Queue(maxsize=size)
+        self.min_idle = min(kwargs.pop("min_idle", 0), size)
+        prewarm = kwargs.pop("prewarm", False)
+        self.max_lifetime = kwargs.pop("max_lifetime", None)
+        self.idle_timeout = kwargs.pop("idle_timeout", None)
+        self.recycled = {"lifetime": 0, "idle": 0}
+        # Expiry and last return times of the pooled connections keyed
+        # by their ids, as not every driver's connection accepts
+        # additional attributes.
+        self._expires = {}
+        self._returned = {}
+        self._use_lifo = kwargs.pop("use_lifo", False)
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._waiters = deque()
         self._pessimistic = kwargs.get("pessimistic", False)
         self._conn = conn_class(url, **kwargs)
         if self._conn.persist:
             raise ValueError("Persistent connections are not allowed")
+        self._maintainer = None
+        if prewarm:
+            self.prewarm(wait=prewarm != "background")
+        reap_interval = self._reap_interval()
+        if self.min_idle or reap_interval:
+            self._maintainer = Maintainer(self, reap_interval=reap_interval)
 
-    def _inc_overflow(self):
-        if self._MAX == -1:
-            self._overflow += 1
-            return True
-        with self._overflow_lock:
-            if self._overflow < self._MAX:
+    def _reap_interval(self):
+        timeouts = [t for t in (self.max_lifetime, self.idle_timeout) if t]
+        if not timeouts:
+            return None
+        return min(min(timeouts) / 4, MAX_REAP_INTERVAL)
+
+    def _open(self, autocommit=False):
+        conn = self._conn.get(autocommit=autocommit)
+        if self.max_lifetime:
+            jitter = random.uniform(0, self.max_lifetime * LIFETIME_JITTER)
+            expires = time.monotonic() + self.max_lifetime - jitter
+            self._expires[id(conn)] = expires
+        return conn
+
+    def _forget(self, conn):
+        self._expires.pop(id(conn), None)
+        self._returned.pop(id(conn), None)
+
+    def _expired(self, conn, now=None):
+        expires = self._expires.get(id(conn))
+        if expires is None:
+            return False
+        return (now or time.monotonic()) >= expires
+
+    def _timed_out(self, conn, now):
+        returned = self._returned.get(id(conn))
+        if not self.idle_timeout or returned is None:
+            return False
+        return now - returned >= self.idle_timeout
+
+    def _idle_time(self, conn):
+        returned = self._returned.get(id(conn))
+        if returned is None:
+            return None
+        return time.monotonic() - returned
+
+    def _recycle(self, conn, reason):
+        with self._lock:
+            self.recycled[reason] += 1
+        self._discard(conn)
+
+    def _reserve(self):
+        # Count a connection opened for the pool itself. Only up to
+        # ``size`` connections are opened this way.
+        with self._lock:
+            if self._overflow < 0:
                 self._overflow += 1
                 return True
+            return False
 
-    def _dec_overflow(self):
-        if self._MAX == -1:
-            self._overflow -= 1
-            return True
-        with self._overflow_lock:
-            self._overflow -= 1
+    def _checkout(self):
+        # Returns an idle connection, None if a new connection may be
+        # opened or a Waiter if the pool is exhausted.
+        with self._lock:
+            if self._idle:
+                if self._use_lifo:
+                    return self._idle.pop()
+                return self._idle.popleft()
+            if self._MAX == -1 or self._overflow < self._MAX:
+                self._overflow += 1
+                return None
+            waiter = Waiter()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _checkin(self, conn):
+        # Hand the connection over to the longest waiting thread or
+        # keep it. Returns False if the pool is full.
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().wake(conn)
+            elif len(self._idle) < self._size:
+                self._idle.append(conn)
+            else:
+                return False
             return True
 
+    def _release(self):
+        # Give up the slot of a closed connection. A waiting thread
+        # takes it over to open a new connection.
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().wake()
+            else:
+                self._overflow -= 1
+        self._refill()
+
+    def _refill(self):
+        # Wake up the maintainer only if it has to open connections.
+        # Expired and idle connections are reaped on its own schedule.
+        maintainer = self._maintainer
+        if maintainer is not None and self.checkedin < self.min_idle:
+            maintainer.notify()
+
+    def _wait(self, waiter):
+        if waiter.wait(self._timeout):
+            return waiter.conn
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                # Served right after the timeout expired
+                return waiter.conn
+        raise TimeoutError(
+            "QueuePool limit of size %d overflow %d reached, "
+            "connection timed out, timeout %d"
+            % (self.size, self.overflow, self._timeout)
+        )
+
+    def _add_idle(self):
+        """Open a connection and put it into the pool. Returns ``False``
+        if the pool is already full."""
+        if not self._reserve():
+            return False
+        try:
+            conn = self._open()
+        except Exception:
+            self._release()
+            raise
+        self._returned[id(conn)] = time.monotonic()
+        if not self._checkin(conn):
+            self._discard(conn)
+            return False
+        return True
+
+    def fill(self):
+        """Open connections until ``min_idle`` of them are idle."""
+        while self.checkedin < self.min_idle and self._add_idle():
+            pass
+
+    def prewarm(self, count=None, wait=True):
+        """Open ``count`` connections in parallel and put them into the
+        pool. Defaults to ``min_idle`` or, if it is 0, ``size``.
+
+        If ``wait`` is ``False`` the connections are opened in the
+        background and errors are ignored.
+        """
+        count = count or self.min_idle or self.size
+        executor = ThreadPoolExecutor(max_workers=count)
+        futures = [executor.submit(self._add_idle) for _ in range(count)]
+        executor.shutdown(wait=wait)
+        if wait:
+            for future in futures:
+                future.result()
+
+    def reap(self):
+        """Close idle connections which exceeded ``max_lifetime`` or
+        ``idle_timeout``. Connections are only closed for being idle as
+        long as more than ``min_idle`` of them remain in the pool."""
+        if not (self.max_lifetime or self.idle_timeout):
+            return
+        now = time.monotonic()
+        reaped = []
+        with self._lock:
+            idle = self._idle
+            for conn in list(idle):
+                if self._expired(conn, now):
+                    reason = "lifetime"
+                elif self._timed_out(conn, now) and len(idle) > self.min_idle:
+                    reason = "idle"
+                else:
+                    continue
+                idle.remove(conn)
+                reaped.append((conn, reason))
+        for conn, reason in reaped:
+            self._recycle(conn, reason)
+
+    def _discard(self, conn):
+        self._forget(conn)
+        try:
+            self._conn.close(conn)
+        finally:
+            self._release()
+
     def put(self, conn):
-        # Always rollback possibly open transaction so that as the
+        if self._expired(conn):
+            self._recycle(conn, "lifetime")
+            return
+        # Rollback possibly open transaction so that as the
         # connection is set up to be used again, it’s in a “clean”
         # state with no references held to the previous series of
-        # operations.
-        conn.rollback()
-        self._conn.disable_autocommit(conn)
+        # operations. A connection which can't be reset is closed,
+        # otherwise its slot would be lost.
         try:
-            self._pool.put(conn, False)
-        except Full:
-            try:
-                self._conn.close(conn)
-            finally:
-                self._dec_overflow()
+            self._conn.reset(conn)
+        except Exception:
+            self._discard(conn)
+            raise
+        self._returned[id(conn)] = time.monotonic()
+        if not self._checkin(conn):
+            self._discard(conn)
 
     def get(self, autocommit=False):
-        use_overflow = self._MAX > -1
+        conn = self._checkout()
+        if isinstance(conn, Waiter):
+            conn = self._wait(conn)
+        self._refill()
+        if conn is None:
+            return self._open_reserved(autocommit)
+        if self._expired(conn):
+            with self._lock:
+                self.recycled["lifetime"] += 1
+            return self._replace(conn, autocommit)
+        if self._pessimistic:
+            try:
+                self._conn.verify(conn, self._idle_time(conn))
+            except OperationalError:
+                return self._replace(conn, autocommit)
+        return self._conn.enable_autocommit_if(autocommit, conn)
 
+    def _replace(self, conn, autocommit):
+        # Close a checked out connection and open a new one in its slot,
+        # so that the thread doesn't have to queue up again.
+        self._forget(conn)
         try:
-            wait = use_overflow and self._overflow >= self._MAX
-            conn = self._pool.get(wait, self._timeout)
-            if self._pessimistic:
-                try:
-                    self._conn.check(conn)
-                except OperationalError:
-                    self._conn.close(conn)
-                    return self._conn.get(autocommit=autocommit)
-            return conn
-        except Empty:
-            # Don't do things inside of "except Empty", because when we say
-            # we timed out or can't connect and raise, Python 3 tells
-            # people the real error is queue.Empty which it isn't.
-            pass
-        if use_overflow and self._overflow >= self._MAX:
-            raise TimeoutError(
-                "QueuePool limit of size %d overflow %d reached, "
-                "connection timed out, timeout %d"
-                % (self.size, self.overflow, self._timeout)
-            )
-
-        if self._inc_overflow() is True:
-            try:
-                return self._conn.get(autocommit=autocommit)
-            except Exception as e:
-                self._dec_overflow()
-                raise e
+            self._conn.close(conn)
+        except Exception:
+            self._release()
+            raise
+        return self._open_reserved(autocommit)
+
+    def _open_reserved(self, autocommit):
+        # Open a connection for a slot which is already counted
+        try:
+            return self._open(autocommit=autocommit)
+        except Exception:
+            self._release()
+            raise
 
     def cursor(self, conn):
         return conn.cursor()
 
+    def stream_cursor(self, conn, plain=False):
+        return self._conn.stream_cursor(conn, plain=plain)
+
     def get_cursor_attr(self, cursor, key):
         return self._conn.get_cursor_attr(cursor, key)
 
+    def execute_batch(self, cursor, statements):
+        return self._conn.execute_batch(cursor, statements)
+
+    def copy_in(self, cursor, table, rows, columns=None):
+        return self._conn.copy_in(cursor, table, rows, columns=columns)
+
+    def copy_out(self, cursor, content, params, sink, options=None):
+        return self._conn.copy_out(
+            cursor, content, params, sink, options=options
+        )
+
     @property
     def has_rowcount(self):
         return self._conn.has_rowcount
 
-    def close(self):
-        while True:
-            try:
-                conn = self._pool.get(False)
-                conn.close()
-            except Empty:
-                break
+    @property
+    def count_subquery(self):
+        return self._conn.count_subquery
+
+    @property
+    def paramstyle(self):
+        return self._conn.paramstyle
 
-        self._overflow = 0 - self.size
+    @property
+    def arrow_types(self):
+        return self._conn.arrow_types
+
+    def arrow_type_keys(self, cursor):
+        return self._conn.arrow_type_keys(cursor)
+
+    @property
+    def checks(self):
+        return self._conn.checks
+
+    @property
+    def check_rate(self):
+        return self._conn.check_rate
+
+    def close(self):
+        if self._maintainer is not None:
+            self._maintainer.stop()
+            self._maintainer = None
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._overflow = 0 - self.size
+        for conn in idle:
+            conn.close()
+        self._expires.clear()
+        self._returned.clear()
 
     def status(self):
         return (
@@ -143,11 +432,11 @@ class Pool(object):
 
     @property
     def size(self):
-        return self._pool.maxsize
+        return self._size
 
     @property
     def checkedin(self):
-        return self._pool.qsize()
+        return len(self._idle)
 
     @property
     def overflow(self):
@@ -155,7 +444,7 @@ class Pool(object):
 
     @property
     def checkedout(self):
-        return self._pool.maxsize - self._pool.qsize() + self._overflow
+        return self._size - len(self._idle) + self._overflow
 
     def mogrify(self, cursor, content, params):
         return self._conn.mogrify(cursor, content, params)
@@ -1,8 +1,14 @@
 try:
     import MySQLdb
+    from MySQLdb.constants import (
+        FIELD_TYPE,
+        FLAG,
+    )
     from MySQLdb.cursors import (
         Cursor,
         DictCursor,
+        SSCursor,
+        SSDictCursor,
     )
 except ImportError as e:
     raise ImportError(
@@ -13,6 +19,32 @@ from .. import (
     conn,
     exc,
 )
+from ..sql import (
+    arguments,
+    multirow,
+    parse,
+)
+
+# pyarrow types by field type. Strings and blobs share type codes
+# with their binary counterparts and are inferred from the values.
+ARROW_TYPES = {
+    FIELD_TYPE.TINY: ("int8",),
+    FIELD_TYPE.SHORT: ("int16",),
+    FIELD_TYPE.INT24: ("int32",),
+    FIELD_TYPE.LONG: ("int64",),
+    FIELD_TYPE.LONGLONG: ("int64",),
+    FIELD_TYPE.FLOAT: ("float32",),
+    FIELD_TYPE.DOUBLE: ("float64",),
+    FIELD_TYPE.DATE: ("date32",),
+    FIELD_TYPE.DATETIME: ("timestamp", "us"),
+    FIELD_TYPE.TIMESTAMP: ("timestamp", "us"),
+    # Integer columns with the UNSIGNED flag (see arrow_type_keys)
+    (FIELD_TYPE.TINY, "unsigned"): ("uint8",),
+    (FIELD_TYPE.SHORT, "unsigned"): ("uint16",),
+    (FIELD_TYPE.INT24, "unsigned"): ("uint32",),
+    (FIELD_TYPE.LONG, "unsigned"): ("uint32",),
+    (FIELD_TYPE.LONGLONG, "unsigned"): ("uint64",),
+}
 
 
 class Connection(conn.Connection):
@@ -20,15 +52,82 @@ class Connection(conn.Connection):
         super().__init__(url, kwargs)
         self.hostname = self.url.hostname or "localhost"
         self.port = self.url.port or 3306
+        self.arrow_types = ARROW_TYPES
+        # Derived tables with duplicate column names, e. g. SELECT * of
+        # a join, fail with error 1060
+        self.count_subquery = False
         if kwargs.pop("dict_cursor", False):
             self.cursor_factory = DictCursor
+            self.stream_cursor_factory = SSDictCursor
         else:
             self.cursor_factory = Cursor
+            self.stream_cursor_factory = SSCursor
         self._init_conn()
 
     def cursor(self, conn):
         return conn.cursor()
 
+    def stream_cursor(self, conn, plain=False):
+        # Unbuffered cursors read the rows from the server while
+        # they are fetched.
+        if plain:
+            return conn.cursor(SSCursor)
+        return conn.cursor(self.stream_cursor_factory)
+
+    def get_cursor_attr(self, cursor, key):
+        if key == "executemany":
+
+            def executemany(content, params):
+                return self.executemany(cursor, content, params)
+
+            return executemany
+        return getattr(cursor, key)
+
+    def arrow_type_keys(self, cursor):
+        # The UNSIGNED flag is not part of the description. MySQLdb
+        # reports it in description_flags.
+        keys = super().arrow_type_keys(cursor)
+        flags = getattr(cursor, "description_flags", None)
+        if not flags:
+            return keys
+        result = []
+        for key, flag in zip(keys, flags):
+            unsigned = (key, "unsigned")
+            if flag & FLAG.UNSIGNED and unsigned in self.arrow_types:
+                key = unsigned
+            result.append(key)
+        return result
+
+    def executemany(self, cursor, content, params):
+        """Send ``INSERT`` statements with a single ``VALUES`` row as
+        one multi-row ``INSERT``. mysqlclient's own rewriting only
+        handles rows consisting of placeholders."""
+        rewritten = multirow(content, params)
+        if rewritten is None:
+            return cursor.executemany(content, params)
+        return cursor.execute(*rewritten)
+
+    def execute_batch(self, cursor, statements):
+        """Send all statements as a single multi-statement query and
+        read their results one after another."""
+        parts = []
+        args = []
+        for content, params in statements:
+            sql = parse(content)
+            if sql.ends:
+                sql = parse(content[: sql.ends[0]])
+            template = sql.positional()
+            if template is None or len(sql.keywords) != 1:
+                return super().execute_batch(cursor, statements)
+            # The newline terminates a trailing line comment
+            parts.append(template + "\n")
+            args.extend(arguments(sql.params, params))
+        cursor.execute(";\n".join(parts), args)
+        results = [(cursor.fetchall(), cursor.rowcount)]
+        while cursor.nextset():
+            results.append((cursor.fetchall(), cursor.rowcount))
+        return results
+
     def create_conn(self, **kwargs):
         try:
             conn = MySQLdb.connect(
@@ -45,14 +144,22 @@ class Connection(conn.Connection):
         return self.disable_autocommit(conn)
 
     def enable_autocommit_if(self, autocommit, conn):
-        if autocommit:
+        # get_autocommit() reads the status of the last server response,
+        # while changing it costs a round trip.
+        if autocommit and not conn.get_autocommit():
             conn.autocommit(True)
         return conn
 
     def disable_autocommit(self, conn):
-        conn.autocommit(False)
+        if conn.get_autocommit():
+            conn.autocommit(False)
         return conn
 
+    def in_transaction(self, conn):
+        # mysqlclient doesn't expose the transaction status. Without
+        # autocommit every statement, even a SELECT, starts one.
+        return not conn.get_autocommit()
+
     def mogrify(self, cursor, content, params):
         return cursor._executed.decode("utf-8")
 
@@ -62,3 +169,11 @@ class Connection(conn.Connection):
             cur.execute("SELECT 1")
         except MySQLdb.OperationalError as e:
             raise exc.OperationalError from e
+
+    def _ping(self, conn):
+        try:
+            # Without arguments ping doesn't turn on reconnecting, which
+            # would silently lose the session state.
+            conn.ping()
+        except (MySQLdb.OperationalError, MySQLdb.InterfaceError) as e:
+            raise exc.OperationalError from e
@@ -1,3 +1,6 @@
+import itertools
+from collections.abc import Mapping
+
 try:
     import psycopg2
 except ImportError as e:
@@ -7,15 +10,123 @@ except ImportError as e:
     ) from e
 
 
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extensions import connection as BaseConnection
+from psycopg2.extensions import cursor as BaseCursor
 from psycopg2.extras import (
     DictCursor,
     DictRow,
+    execute_batch,
+    execute_values,
 )
 
 from .. import (
     conn,
     exc,
 )
+from ..cache import StatementCache
+from ..sql import parse
+
+# Statements PostgreSQL is able to prepare
+PREPARABLE = {
+    "SELECT",
+    "INSERT",
+    "UPDATE",
+    "DELETE",
+    "MERGE",
+    "VALUES",
+    "WITH",
+}
+# Statements which deallocate prepared statements
+DEALLOCATING = {"DISCARD", "DEALLOCATE"}
+# SQLSTATE of "prepared statement does not exist"
+INVALID_STATEMENT_NAME = "26000"
+# Provides unique names for server-side cursors
+cursor_ids = itertools.count(1)
+# pyarrow types by type OID
+ARROW_TYPES = {
+    16: ("bool_",),
+    20: ("int64",),
+    21: ("int16",),
+    23: ("int32",),
+    700: ("float32",),
+    701: ("float64",),
+    25: ("string",),
+    1042: ("string",),
+    1043: ("string",),
+    1082: ("date32",),
+    1114: ("timestamp", "us"),
+}
+# Characters escaped in the text format of COPY
+COPY_ESCAPES = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+)
+# Number of bytes psycopg2 requests from a COPY FROM source at once
+COPY_SIZE = 65536
+
+
+def quote_ident(name):
+    """Quote a possibly schema qualified identifier."""
+    return ".".join(
+        '"{}"'.format(part.replace('"', '""')) for part in name.split(".")
+    )
+
+
+def copy_value(value):
+    """Return ``value`` in the text format of COPY. Values of types
+    without special handling are converted using ``str()``."""
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = "\\x" + bytes(value).hex()
+    return str(value).translate(COPY_ESCAPES)
+
+
+def execute_prepared(name, args):
+    query = "EXECUTE " + name
+    if args:
+        query += " ({})".format(", ".join(args))
+    return query
+
+
+class CopyReader(object):
+    """
+    A file-like object which serializes rows to the text format of
+    COPY while psycopg2 reads from it, so that only the requested
+    amount of data is held in memory.
+
+    Rows can be sequences or row objects. If ``columns`` are given the
+    values of rows with keys, e. g. changeling rows, are taken by name.
+    Mappings like dicts have no order of their own and require
+    ``columns``.
+    """
+
+    def __init__(self, rows, columns=None):
+        self.rows = iter(rows)
+        self.columns = columns
+
+    def line(self, row):
+        if self.columns and hasattr(row, "keys"):
+            row = [row[column] for column in self.columns]
+        elif isinstance(row, Mapping):
+            # Iterating would yield the keys instead of the values
+            raise ValueError("Copying mappings requires columns")
+        return "\t".join([copy_value(value) for value in row]) + "\n"
+
+    def read(self, size=-1):
+        lines = []
+        length = 0
+        for row in self.rows:
+            line = self.line(row)
+            lines.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        return "".join(lines)
 
 
 class PostgresChangelingRow(DictRow):
@@ -80,9 +191,20 @@ class PostgresChangelingCursor(DictCursor):
         self._prefetch = 1
 
 
+class PreparingConnection(BaseConnection):
+    """A psycopg2 connection which holds the cache of its prepared
+    statements. A new connection starts with an empty cache."""
+
+    def __init__(self, *args, size=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = StatementCache(size)
+
+
 class Connection(conn.Connection):
     def __init__(self, url, **kwargs):
         super().__init__(url, kwargs)
+        self.prepare = self.dbapi_kwargs.pop("prepare", 0)
+        self.arrow_types = ARROW_TYPES
 
         self.hostname = self.url.hostname or "localhost"
         self.port = self.url.port or 5432
@@ -92,26 +214,188 @@ class Connection(conn.Connection):
             self.factory = psycopg2.extras.DictCursor
         self._init_conn()
 
+    def stream_cursor(self, conn, plain=False):
+        # A named cursor fetches the rows in batches of the size passed
+        # to fetchmany. Outside of transactions it has to be declared
+        # WITH HOLD.
+        return conn.cursor(
+            "quma_stream_{}".format(next(cursor_ids)),
+            cursor_factory=BaseCursor if plain else self.factory,
+            withhold=conn.autocommit,
+        )
+
     def get_cursor_attr(self, cursor, key):
         # PG is the only one of the supported DBMS which
         # raises an error when fetchall is called after
         # a CREATE, INSERT, UPDATE and so on.
         # mysqlclient and sqlite3 return an empty tuple.
         # We do it that way too to provide an uniform api.
-        if key in ("fetchall", "fetchmany"):
+        if key in ("fetchall", "fetchmany", "fetchone"):
 
             def fetch(*args, **kwargs):
                 try:
                     return getattr(cursor, key)(*args, **kwargs)
                 except psycopg2.ProgrammingError as e:
                     if str(e) == "no results to fetch":
-                        return ()
+                        return None if key == "fetchone" else ()
                     raise exc.FetchError(e) from e
 
             return fetch
+        if key == "execute" and self.prepare:
+
+            def execute(content, params=None):
+                return self.execute(cursor, content, params)
+
+            return execute
+        if key == "executemany":
+
+            def executemany(content, params):
+                return self.executemany(cursor, content, params)
+
+            return executemany
         return getattr(cursor, key)
 
+    def _preparable(self, cursor, statements, sql, params):
+        if statements is None or params is None:
+            return False
+        # Named cursors wrap the query into DECLARE ... CURSOR FOR
+        if cursor.name is not None:
+            return False
+        if sql.content in statements.excluded:
+            return False
+        # Placeholders are rendered as pyformat, a remaining ? is an
+        # operator like jsonb's ? and must not be numbered.
+        if sql.style == "qmark":
+            return False
+        # Only single statements can be prepared
+        return len(sql.keywords) == 1 and sql.keywords[0] in PREPARABLE
+
+    def execute(self, cursor, content, params=None):
+        """Execute ``content`` as prepared statement if possible.
+
+        Prepared statements are kept per connection and executed with
+        ``EXECUTE``. A statement is prepared in the same round trip as
+        its first execution.
+        """
+        statements = getattr(cursor.connection, "statements", None)
+        sql = parse(content)
+        numbered = None
+        if self._preparable(cursor, statements, sql, params):
+            numbered = sql.numbered()
+        if numbered is None:
+            cursor.execute(content, params)
+            if statements is not None:
+                if DEALLOCATING.intersection(sql.keywords):
+                    statements.clear()
+            return
+
+        body, args = numbered
+        name = statements.get(content)
+        if name is None:
+            self._prepare(cursor, statements, content, body, args, params)
+            return
+        try:
+            cursor.execute(execute_prepared(name, args), params)
+        except psycopg2.Error as e:
+            # Statements are not transactional and are kept on errors,
+            # unless the session was reset, e. g. by DISCARD ALL.
+            if e.pgcode == INVALID_STATEMENT_NAME:
+                statements.clear()
+            raise
+
+    def _prepare(self, cursor, statements, content, body, args, params):
+        """Prepare ``content`` in the same round trip as its first
+        execution.
+
+        Inside of transactions ``PREPARE`` is wrapped in a savepoint.
+        If PostgreSQL can't prepare the statement, for example because
+        the type of a parameter can't be determined, the transaction is
+        rolled back to the savepoint and the statement is executed
+        unprepared from then on.
+        """
+        name, evicted = statements.add(content)
+        parts = ["DEALLOCATE {};\n".format(old) for old in evicted]
+        # The newline terminates a trailing line comment of the body
+        parts.append("PREPARE {} AS {}\n;\n".format(name, body))
+        conn = cursor.connection
+        savepoint = not conn.autocommit or self.in_transaction(conn)
+        if savepoint:
+            parts.insert(0, "SAVEPOINT quma_prepare;\n")
+            parts.append("RELEASE SAVEPOINT quma_prepare;\n")
+        parts.append(execute_prepared(name, args))
+        try:
+            cursor.execute("".join(parts), params)
+            return
+        except psycopg2.Error as e:
+            code = e.pgcode or ""
+            if not (code.startswith("42") or code == INVALID_STATEMENT_NAME):
+                raise
+            if savepoint:
+                try:
+                    cursor.execute(
+                        "ROLLBACK TO SAVEPOINT quma_prepare;\n"
+                        "RELEASE SAVEPOINT quma_prepare"
+                    )
+                except psycopg2.Error:
+                    # The savepoint was already released, so the
+                    # statement was prepared and EXECUTE failed.
+                    raise e from None
+            if code == INVALID_STATEMENT_NAME:
+                # An evicted statement didn't exist anymore
+                statements.clear()
+            else:
+                statements.exclude(content)
+        cursor.execute(content, params)
+
+    def executemany(self, cursor, content, params):
+        """Execute ``content`` for all items of ``params`` in a single
+        round trip.
+
+        ``INSERT`` statements with a single ``VALUES`` row are sent as
+        one multi-row ``INSERT``, all others as a batch of statements.
+        """
+        values = parse(content).values()
+        if values is None:
+            execute_batch(cursor, content, params, page_size=len(params))
+            return
+        prefix, row, rest = values
+        execute_values(
+            cursor,
+            prefix + "%s" + rest,
+            params,
+            template=row,
+            page_size=len(params),
+        )
+
+    def copy_in(self, cursor, table, rows, columns=None):
+        """Load ``rows`` into ``table`` using ``COPY ... FROM STDIN``."""
+        statement = "COPY " + quote_ident(table)
+        if columns:
+            names = ", ".join([quote_ident(column) for column in columns])
+            statement += " ({})".format(names)
+        cursor.copy_expert(
+            statement + " FROM STDIN",
+            CopyReader(rows, columns),
+            size=COPY_SIZE,
+        )
+        return cursor.rowcount
+
+    def copy_out(self, cursor, content, params, sink, options=None):
+        """Write the result of ``content``, a ``COPY (...) TO STDOUT``
+        statement, to the file-like object ``sink``."""
+        statement = self.mogrify(cursor, content, params)
+        if options:
+            statement += " WITH ({})".format(options)
+        cursor.copy_expert(statement, sink, size=COPY_SIZE)
+        return cursor.rowcount
+
     def create_conn(self, **kwargs):
+        if self.prepare:
+
+            def factory(*args, **kwargs):
+                return PreparingConnection(*args, size=self.prepare, **kwargs)
+
+            kwargs["connection_factory"] = factory
         try:
             return psycopg2.connect(
                 database=self.database,
@@ -126,14 +410,19 @@ class Connection(conn.Connection):
             raise exc.ConnectionError(str(e)) from e
 
     def enable_autocommit_if(self, autocommit, conn):
-        if autocommit:
+        if autocommit and not conn.autocommit:
             conn.autocommit = True
         return conn
 
     def disable_autocommit(self, conn):
-        conn.autocommit = False
+        if conn.autocommit:
+            conn.autocommit = False
         return conn
 
+    def in_transaction(self, conn):
+        # The status is tracked by libpq without a round trip
+        return conn.get_transaction_status() != TRANSACTION_STATUS_IDLE
+
     def mogrify(self, cursor, content, params):
         return cursor.mogrify(content, params).decode("utf-8")
 
@@ -143,3 +432,13 @@ class Connection(conn.Connection):
             cur.execute("SELECT 1")
         except psycopg2.OperationalError as e:
             raise exc.OperationalError from e
+
+    def _ping(self, conn):
+        if conn.closed:
+            raise exc.OperationalError("Connection already closed")
+        try:
+            # Reads pending input without a round trip, which fails
+            # if the server closed the connection.
+            conn.poll()
+        except psycopg2.Error as e:
+            raise exc.OperationalError from e
@@ -64,11 +64,18 @@ class Connection(conn.Connection):
         if not self.database:
             raise ValueError("Required database path missing")
         self.has_rowcount = False
+        self.paramstyle = "qmark"
         self._init_conn()
 
     def cursor(self, conn):
         return conn.cursor()
 
+    def stream_cursor(self, conn, plain=False):
+        cursor = conn.cursor()
+        if plain:
+            cursor.row_factory = None
+        return cursor
+
     def create_conn(self, **kwargs):
         try:
             conn = sqlite3.connect(database=self.database, **kwargs)
@@ -79,14 +86,18 @@ class Connection(conn.Connection):
         return self.disable_autocommit(conn)
 
     def enable_autocommit_if(self, autocommit, conn):
-        if autocommit:
+        if autocommit and conn.isolation_level is not None:
             conn.isolation_level = None
         return conn
 
     def disable_autocommit(self, conn):
-        conn.isolation_level = "DEFERRED"
+        if conn.isolation_level != "DEFERRED":
+            conn.isolation_level = "DEFERRED"
         return conn
 
+    def in_transaction(self, conn):
+        return conn.in_transaction
+
     def _check(self, conn):
         try:
             cur = conn.cursor()
@@ -95,3 +106,10 @@ class Connection(conn.Connection):
             raise exc.OperationalError from e
         except sqlite3.OperationalError as e:
             raise exc.OperationalError from e
+
+    def _ping(self, conn):
+        try:
+            # Creating a cursor fails if the connection was closed
+            conn.cursor().close()
+        except sqlite3.ProgrammingError as e:
+            raise exc.OperationalError from e
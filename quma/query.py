@@ -1,4 +1,13 @@
-from . import exc
+from . import (
+    arrow,
+    exc,
+)
+from .columns import Columns
+
+# Counts the rows of a query's result on the server
+COUNT = "SELECT count(*) AS count FROM (\n{}\n) AS q"
+# Checks on the server if a query's result has rows
+EXISTS = "SELECT EXISTS (\n{}\n) AS e"
 
 
 class ManyResult(object):
@@ -23,6 +32,57 @@ class ManyResult(object):
         return self.cursor.fetchmany(size)
 
 
+class Batch(object):
+    """
+    Collects queries and executes them together when the context
+    ends, in a single round trip if the provider supports it.
+
+    Afterwards every query holds its own result.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+
+    def add(self, query):
+        """Add ``query`` to the batch and return it."""
+        if query.cursor is not self.cursor:
+            raise ValueError("The query uses another cursor")
+        self.queries.append(query)
+        return query
+
+    def run(self):
+        """Execute all collected queries."""
+        queries, self.queries = self.queries, []
+        if not queries:
+            return
+        statements = [
+            query.script.statement(
+                self.cursor,
+                list(query.args),
+                query.kwargs,
+                query.prepare_params,
+            )
+            for query in queries
+        ]
+        results = self.cursor.conn.execute_batch(
+            self.cursor.raw_cursor, statements
+        )
+        for query, (content, params), (rows, rowcount) in zip(
+            queries, statements, results
+        ):
+            query._set_result(rows, rowcount)
+            if query.script.echo:
+                query.script.mogrify(self.cursor, content, params)
+
+
 class Query(object):
     """
     The query object is the value you get when you run a query,
@@ -37,6 +97,10 @@ class Query(object):
         self.prepare_params = prepare_params
         self._has_been_executed = False
         self._result_cache = None
+        self._rowcount = -1
+        self._count_cache = None
+        # Rows already read using fetchone
+        self._head = []
 
     def run(self):
         """Execute the query using the DBAPI driver."""
@@ -45,18 +109,64 @@ class Query(object):
         )
         self._has_been_executed = True
         self._result_cache = None
+        self._count_cache = None
+        self._head = []
+        if self.cursor.has_rowcount:
+            self._rowcount = self.cursor.rowcount
         return self
 
+    def _set_result(self, rows, rowcount):
+        # Store the result of an execution by a Batch
+        self._has_been_executed = True
+        self._result_cache = rows
+        self._count_cache = None
+        self._head = []
+        if self.cursor.has_rowcount:
+            self._rowcount = rowcount
+
+    def _execute_wrapped(self, wrapper):
+        return self.script.execute(
+            self.cursor,
+            list(self.args),
+            self.kwargs,
+            self.prepare_params,
+            wrapper=wrapper,
+        )
+
+    def _scalar(self):
+        row = self.cursor.fetchone()
+        try:
+            return row[0]
+        except KeyError:
+            # dict rows
+            return next(iter(row.values()))
+
     def _fetch(self):
         if not self._has_been_executed:
             self.run()
         if self._result_cache is None:
             try:
-                self._result_cache = self.cursor.fetchall()
+                rows = self.cursor.fetchall()
             except exc.FetchError as e:
                 raise e.error from e
+            if self._head:
+                rows = type(rows)(self._head) + rows
+            self._result_cache = rows
         return self._result_cache
 
+    def _fetchone(self):
+        # Read the next row and remember it, so that a later fetch
+        # still returns the complete result.
+        if not self._has_been_executed:
+            self.run()
+        try:
+            row = self.cursor.fetchone()
+        except exc.FetchError as e:
+            raise e.error from e
+        if row is not None:
+            self._head.append(row)
+        return row
+
     def __getattr__(self, key):
         return getattr(self.cursor, key)
 
@@ -70,18 +180,42 @@ class Query(object):
     def __bool__(self):
         return len(self._fetch()) > 0
 
+    def _count(self):
+        # Let the server count the rows of a query which has not been
+        # executed yet. Returns None if the script is not a SELECT.
+        if self._count_cache is None and self._execute_wrapped(COUNT):
+            self._count_cache = self._scalar()
+        return self._count_cache
+
     def _len(self):
-        self.run()
-        if self.cursor.has_rowcount:
-            return self.cursor.rowcount
-        else:
-            return len(self._fetch())
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        if not self._has_been_executed:
+            if self._count_cache is not None:
+                return self._count_cache
+            self.run()
+        if self._rowcount >= 0:
+            return self._rowcount
+        return len(self._fetch())
 
     def __len__(self):
         return self._len()
 
     def count(self):
-        """Return the length of the result."""
+        """Return the length of the result.
+
+        The rows of an unexecuted single ``SELECT`` or ``VALUES`` query
+        are counted on the server without executing the query itself,
+        if the provider supports it.
+        """
+        if (
+            self._result_cache is None
+            and not self._has_been_executed
+            and self.cursor.count_subquery
+        ):
+            count = self._count()
+            if count is not None:
+                return count
         return self._len()
 
     def all(self):
@@ -91,24 +225,26 @@ class Query(object):
     def one(self):
         """Get exactly one row and check if only one exists,
         otherwise raise an error.
-        """
-        if not self._has_been_executed:
-            self.run()
 
-        def check_rowcount(rowcount):
-            if rowcount == 0:
-                raise exc.DoesNotExistError()
-            if rowcount > 1:
+        At most two rows are read from the cursor.
+        """
+        if self._result_cache is not None:
+            rows = self._result_cache
+        else:
+            if not self._has_been_executed:
+                self.run()
+            # SQLite does not support rowcount
+            if self._rowcount > 1:
                 raise exc.MultipleRowsError()
+            while len(self._head) < 2 and self._fetchone() is not None:
+                pass
+            rows = self._head
 
-        # SQLite does not support rowcount
-        if self.cursor.has_rowcount:
-            check_rowcount(self.cursor.rowcount)
-            result = self._fetch()
-        else:
-            result = self._fetch()
-            check_rowcount(len(result))
-        return result[0]
+        if len(rows) == 0:
+            raise exc.DoesNotExistError()
+        if len(rows) > 1:
+            raise exc.MultipleRowsError()
+        return rows[0]
 
     def value(self, key=0):
         """Call :func:`one` and return the first column by default.
@@ -119,14 +255,31 @@ class Query(object):
 
     def first(self):
         """Get exactly one row and return None if there is no
-        row present in the result."""
-        try:
-            return self._fetch()[0]
-        except IndexError:
-            return None
+        row present in the result.
+
+        Only the first row is read from the cursor."""
+        if self._result_cache is not None:
+            return self._result_cache[0] if self._result_cache else None
+        if self._head:
+            return self._head[0]
+        return self._fetchone()
 
     def exists(self):
-        """Return if the query's result has rows."""
+        """Return if the query's result has rows.
+
+        The result of an unexecuted ``SELECT`` is checked on the server
+        using ``SELECT EXISTS (<script>)``. Of an executed query at most
+        one row is read."""
+        if self._result_cache is not None:
+            return len(self._result_cache) > 0
+        if self._has_been_executed:
+            if self._rowcount >= 0:
+                return self._rowcount > 0
+            return bool(self._head) or self._fetchone() is not None
+        if self._count_cache is not None:
+            return self._count_cache > 0
+        if self._execute_wrapped(EXISTS):
+            return bool(self._scalar())
         return self._len() > 0
 
     def many(self):
@@ -135,6 +288,99 @@ class Query(object):
         """
         return ManyResult(self)
 
+    def _stream(self, size, plain=False):
+        # Yields the streaming cursor and the fetched batches of rows.
+        # The first batch is always yielded, even if it is empty.
+        # Not the public streaming(), which a script could hide
+        cursor = self.cursor._streaming(plain=plain)
+        try:
+            self.script.execute(
+                cursor, list(self.args), self.kwargs, self.prepare_params
+            )
+            rows = cursor.fetchmany(size)
+            yield cursor, rows
+            while rows:
+                rows = cursor.fetchmany(size)
+                if rows:
+                    yield cursor, rows
+        finally:
+            cursor.raw_cursor.close()
+
+    def stream(self, size=1000):
+        """Return a generator which streams the result from the server.
+
+        The query is executed using a server-side cursor (a named cursor
+        on PostgreSQL, an unbuffered cursor on MySQL/MariaDB) on the
+        connection of the query's cursor. Only ``size`` rows are held in
+        memory at a time. The result isn't cached.
+
+        :param size: The number of rows to be fetched per
+            fetchmany call. Defaults to 1000.
+        """
+        for _, rows in self._stream(size):
+            for row in rows:
+                yield row
+
+    def column_batches(self, size=1000, numpy=None):
+        """Return a generator which streams the result in batches
+        of columns.
+
+        Each batch is a dict like the one returned by :meth:`columns`
+        with at most ``size`` values per column.
+        """
+        for cursor, rows in self._stream(size, plain=True):
+            if rows:
+                columns = Columns(cursor.description, numpy=numpy)
+                columns.extend(rows)
+                yield columns.result()
+
+    def columns(self, size=1000, numpy=None):
+        """Return the result as dict mapping the column names to
+        their values.
+
+        The rows are streamed as plain tuples and fetched in batches of
+        ``size``. Integer and float columns are stored in
+        ``array.array`` objects, other columns in lists. If NumPy is
+        installed, NumPy arrays are returned instead.
+
+        :param numpy: If ``False`` never return NumPy arrays. If
+            ``True`` raise an ImportError if NumPy isn't installed.
+        """
+        columns = None
+        for cursor, rows in self._stream(size, plain=True):
+            if columns is None:
+                columns = Columns(cursor.description, numpy=numpy)
+            columns.extend(rows)
+        return columns.result()
+
+    def to_arrow(self, batch_size=1000):
+        """Return a ``pyarrow.RecordBatchReader`` which streams the
+        result in record batches of at most ``batch_size`` rows.
+
+        The schema is built from the cursor's description. Column types
+        the driver doesn't report are inferred from the first batch, or
+        the first with a value if the column starts with NULLs.
+        Call ``read_all()`` on the reader to get a ``pyarrow.Table``.
+        """
+        arrow.require_pyarrow()
+        conn = self.cursor.conn
+        return arrow.reader(
+            self._stream(batch_size, plain=True),
+            conn.arrow_types,
+            conn.arrow_type_keys,
+        )
+
+    def write_arrow(self, path, format=None, batch_size=1000):
+        """Stream the result into a Parquet or Arrow IPC file.
+
+        :param format: ``'parquet'`` or ``'ipc'``. If not given files
+            ending with ``.parquet`` are written as Parquet files, all
+            others as Arrow IPC files.
+        :return: The number of written rows.
+        """
+        format = arrow.file_format(path, format)
+        return arrow.write(self.to_arrow(batch_size), path, format=format)
+
     def unbunch(self, size=None):
         """Return a generator that simplifies the use of fetchmany.
 
@@ -0,0 +1,228 @@
+import importlib.util
+import threading
+from pathlib import Path
+
+from .bundle import Bundle
+from .cache import ScriptCache
+from .namespace import Namespace
+from .script import (
+    Script,
+    TemplateCache,
+)
+from .watch import Watcher
+
+_lock = threading.Lock()
+_registries = {}
+
+
+class Registry(object):
+    """
+    Holds the namespaces and scripts of a :class:`quma.Database`.
+
+    Everything which does not depend on the database connection lives
+    here, so that several :class:`quma.Database` instances using the
+    same scripts can share a single registry (see :func:`get`).
+
+    Namespaces are initialized with ``db`` as their ``db``. If it is
+    given the namespaces are only created when :meth:`load` is called,
+    so that ``db`` can take over the settings of the registry first.
+    Otherwise the registry itself is used.
+    """
+
+    def __init__(
+        self,
+        sqldirs,
+        file_ext=None,
+        tmpl_ext=None,
+        script_factory=Script,
+        prepare_params=None,
+        echo=False,
+        cache=False,
+        cache_size=None,
+        cache_bytes=None,
+        bundle=None,
+        watch=False,
+        watch_interval=1.0,
+        template_module_dir=None,
+        db=None,
+    ):
+        self.sqldirs = sqldirs
+        self.bundle = None
+        if bundle is not None:
+            self.bundle = Bundle(bundle)
+            if not self.sqldirs:
+                self.sqldirs = self.bundle.sqldirs
+            file_ext = file_ext or self.bundle.file_ext
+            tmpl_ext = tmpl_ext or self.bundle.tmpl_ext
+        self.file_ext = file_ext or "sql"
+        self.tmpl_ext = tmpl_ext or "msql"
+        self.script_factory = script_factory
+        self.prepare_params = prepare_params
+        self.echo = echo
+        self.cache = cache
+        self.script_cache = ScriptCache(size=cache_size, max_bytes=cache_bytes)
+        self.watch = watch
+        if self.watch and self.cache is not True:
+            raise ValueError("Watching scripts requires cache=True")
+        if self.watch and self.bundle is not None:
+            raise ValueError("Bundled scripts can't be watched")
+
+        # A single directory
+        if issubclass(type(self.sqldirs), Path):
+            self.sqldirs = str(self.sqldirs)
+        self.templates = TemplateCache(
+            self.sqldirs,
+            module_directory=template_module_dir,
+            bundle=self.bundle,
+        )
+
+        self.namespaces = {}
+        self.watcher = None
+        self.watch_interval = watch_interval
+        self.db = self if db is None else db
+        if db is None:
+            self.load()
+
+    def load(self):
+        """Register the namespaces and start watching them."""
+        self._register_all()
+        if self.watch:
+            self.watcher = Watcher(
+                self.namespaces,
+                interval=self.watch_interval,
+                on_change=self.resolve,
+            )
+            self.watcher.start()
+
+    def _register_all(self):
+        if self.bundle is not None:
+            self.register_bundle(self.bundle)
+        else:
+            try:
+                self.register_namespace(self.sqldirs)
+            except TypeError:
+                # A list/collection of directories
+                for sqldir in self.sqldirs:
+                    self.register_namespace(sqldir)
+
+        if self.cache is True or self.bundle is not None:
+            self.resolve()
+
+    def _instantiate(self, ns, ns_class, path):
+        if ns in self.namespaces:
+            # pass the old namespace to the new instance
+            shadow = self.namespaces[ns]
+            self.namespaces[ns] = ns_class(self.db, path, shadow=shadow)
+        else:
+            self.namespaces[ns] = ns_class(self.db, path)
+
+    def _register(self, ns, path, load_module):
+        try:
+            module = load_module()
+            if ns == "__root__":
+                class_name = "Root"
+            else:
+                # snake_case to CamelCase
+                class_name = "".join([s.title() for s in ns.split("_")])
+            ns_class = getattr(module, class_name)
+            if hasattr(ns_class, "alias"):
+                self._instantiate(ns_class.alias, ns_class, path)
+            self._instantiate(ns, ns_class, path)
+        except (AttributeError, FileNotFoundError):
+            self._instantiate(ns, Namespace, path)
+
+    def register_namespace(self, sqldir):
+        def register(path, ns):
+            def load_module():
+                mod_path = str(path / "__init__.py")
+                mod_name = "quma.mapping.{}".format(ns)
+                spec = importlib.util.spec_from_file_location(
+                    mod_name, mod_path
+                )
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                return module
+
+            self._register(ns, path, load_module)
+
+        register(Path(sqldir), "__root__")
+        for path in Path(sqldir).iterdir():
+            if path.is_dir():
+                register(path, path.name)
+
+    def register_bundle(self, bundle):
+        for i in range(len(bundle.dirs)):
+            for ns, path, source in bundle.namespaces(i):
+
+                def load_module(ns=ns, path=path, source=source):
+                    if source is None:
+                        raise FileNotFoundError
+                    return bundle.module(ns, path, source)
+
+                self._register(ns, path, load_module)
+
+    def resolve(self):
+        """Build the resolution tables of all namespaces, shadowed
+        namespaces first."""
+        resolved = set()
+
+        def resolve(namespace):
+            if namespace is None or id(namespace) in resolved:
+                return
+            resolve(namespace.shadow)
+            namespace._resolve()
+            resolved.add(id(namespace))
+
+        for namespace in self.namespaces.values():
+            resolve(namespace)
+
+    def close(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        if self.bundle is not None:
+            self.bundle.close()
+
+
+def _key(settings):
+    prepare_params = settings.get("prepare_params")
+    if prepare_params is not None and "<" in getattr(
+        prepare_params, "__qualname__", "<"
+    ):
+        # Lambdas, nested functions and the like are new objects for
+        # every Database. Each of them would create and keep a registry.
+        raise ValueError(
+            "Shared registries require a module level prepare_params function"
+        )
+    sqldirs = settings["sqldirs"]
+    if isinstance(sqldirs, (str, Path)):
+        sqldirs = [sqldirs]
+    key = dict(settings, sqldirs=tuple(str(d) for d in sqldirs))
+    return tuple((name, key[name]) for name in sorted(key))
+
+
+def get(shared=False, db=None, **settings):
+    """Return a registry for ``settings``.
+
+    If ``shared`` is ``True`` a process-wide registry is returned which
+    is created only once for the same settings. Otherwise a new registry
+    is created whose namespaces are initialized with ``db`` (see
+    :class:`Registry`).
+    """
+    if not shared:
+        return Registry(db=db, **settings)
+    key = _key(settings)
+    with _lock:
+        try:
+            return _registries[key]
+        except KeyError:
+            registry = _registries[key] = Registry(**settings)
+            return registry
+
+
+def clear():
+    """Close and forget all process-wide registries."""
+    with _lock:
+        for registry in _registries.values():
+            registry.close()
+        _registries.clear()
@@ -1,6 +1,20 @@
+import os
 import sys
+import tempfile
+import threading
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
+from itertools import islice
 
+from .bundle import (
+    BundleLookup,
+    source_key,
+)
+from .cache import ScriptCache
 from .query import Query
+from .sql import parse
 
 try:
     from mako.lookup import TemplateLookup
@@ -8,17 +22,169 @@ try:
 except ImportError:
     Template = None
 
+# The maximum number of compiled templates kept by a TemplateCache
+TEMPLATE_CACHE_SIZE = 1024
+
+
+def payload(item):
+    """Return the parameters of ``item`` as dict or list. Rows of
+    previous queries are accepted as well."""
+    if hasattr(item, "keys"):
+        return dict(item)
+    return list(item)
+
+
+def outcome(future, return_exceptions):
+    """Return the result of ``future`` or its exception if
+    ``return_exceptions`` is ``True``."""
+    error = future.exception()
+    if error is None:
+        return future.result()
+    if return_exceptions:
+        return error
+    raise error
+
+
+def shutdown(executor, futures):
+    # Don't start pending items and wait for the running ones, so
+    # that all connections are returned.
+    for future in futures:
+        future.cancel()
+    executor.shutdown()
+
+
+def completed(executor, futures, return_exceptions):
+    indexes = {future: i for i, future in enumerate(futures)}
+    try:
+        for future in as_completed(futures):
+            yield indexes[future], outcome(future, return_exceptions)
+    finally:
+        shutdown(executor, futures)
+
+
+class TemplateCache(object):
+    """
+    Holds compiled Mako templates of a :class:`quma.Database`.
+
+    All templates share a single ``TemplateLookup``. Compiled templates
+    are keyed by a hash of their source, so a changed script gets a new
+    entry and never renders stale code. At most ``size`` templates are
+    kept, the least recently used are evicted first.
+
+    If ``module_directory`` is given the generated Python modules are
+    written to this directory and reused by later processes. If a
+    ``bundle`` is given its precompiled templates are used.
+    """
+
+    def __init__(
+        self,
+        sqldirs,
+        module_directory=None,
+        bundle=None,
+        size=TEMPLATE_CACHE_SIZE,
+    ):
+        self.sqldirs = sqldirs
+        self.module_directory = module_directory
+        self.bundle = bundle
+        self.lock = threading.Lock()
+        self.templates = ScriptCache(size=size)
+        self._lookup_lock = threading.Lock()
+        self._lookup = None
+
+    @property
+    def lookup(self):
+        lookup = self._lookup
+        if lookup is not None:
+            return lookup
+        # Compiling holds self.lock, so the lookup has a lock of its own
+        with self._lookup_lock:
+            if self._lookup is None:
+                kwargs = dict(
+                    directories=self.sqldirs,
+                    module_directory=self.module_directory,
+                )
+                if self.bundle is None:
+                    self._lookup = TemplateLookup(**kwargs)
+                else:
+                    self._lookup = BundleLookup(self.bundle, **kwargs)
+            return self._lookup
+
+    def _compile(self, key, content):
+        if self.bundle is not None:
+            template = self.bundle.template(key, content, self.lookup)
+            if template is not None:
+                return template
+
+        if self.module_directory is None:
+            return Template(content, lookup=self.lookup)
+
+        # Mako only writes module files for file based templates.
+        # The source is stored under its hash so that the module
+        # file of an unchanged script is reused after a restart.
+        uri = "quma_{}.msql".format(key)
+        filename = os.path.join(self.module_directory, uri)
+        if not os.path.isfile(filename):
+            os.makedirs(self.module_directory, exist_ok=True)
+            # The directory may be shared by several processes. Moving
+            # a complete file into place keeps them from reading a
+            # partially written source.
+            fd, tmpname = tempfile.mkstemp(
+                suffix=".tmp", dir=self.module_directory
+            )
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(content)
+                os.replace(tmpname, filename)
+            except BaseException:
+                os.unlink(tmpname)
+                raise
+        return Template(
+            filename=filename,
+            uri=uri,
+            module_directory=self.module_directory,
+            lookup=self.lookup,
+        )
+
+    def get(self, content):
+        key = source_key(content)
+        try:
+            return self.templates.get(key)
+        except KeyError:
+            pass
+        with self.lock:
+            # Another thread may have compiled it in the meantime
+            if key in self.templates:
+                return self.templates.get(key)
+            template = self._compile(key, content)
+            size = len(content.encode("utf-8"))
+            self.templates.put(key, template, size=size)
+            return template
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+            with self._lookup_lock:
+                self._lookup = None
+
 
 class Script(object):
     def __init__(
-        self, content, echo, is_template, sqldirs, prepare_params=None
+        self,
+        content,
+        echo,
+        is_template,
+        sqldirs,
+        prepare_params=None,
+        templates=None,
     ):
         self.echo = echo
         self.content = content
         self.prepare_params = prepare_params
         self.is_template = is_template
         self.sqldirs = sqldirs
+        self.templates = templates
         self.params = None
+        self._sql = None
 
     def __call__(self, cursor, *args, prepare_params=None, **kwargs):
         return Query(self, cursor, args, kwargs, prepare_params)
@@ -26,6 +192,17 @@ class Script(object):
     def __str__(self):
         return self.content
 
+    @property
+    def sql(self):
+        """The analysed content of the script (see :class:`quma.sql.SQL`).
+
+        Plain scripts are parsed only once. Identical contents, e. g. of
+        ad hoc queries, share the result.
+        """
+        if self._sql is None:
+            self._sql = parse(self.content)
+        return self._sql
+
     def mogrify(self, cursor, content, params):
         if content:
             sys.stdout.write("-" * 50)
@@ -35,7 +212,7 @@ class Script(object):
             except AttributeError:
                 sys.stdout.write(content)
 
-    def _prepare(self, cursor, payload, prepare_params):
+    def _params(self, cursor, payload, prepare_params):
         # create an empty list if payload == args
         # create an empty dict if payload == kwargs
         params = type(payload)()
@@ -48,29 +225,152 @@ class Script(object):
             params.update(payload)
         except AttributeError:
             params.extend(payload)
+        return params
 
+    def _prepare(self, cursor, payload, prepare_params):
+        params = self._params(cursor, payload, prepare_params)
         if self.is_template:
-            try:
-                lookup = TemplateLookup(directories=self.sqldirs)
-                return (
-                    Template(self.content, lookup=lookup).render(**params),
-                    params,
-                )
-            except TypeError as e:
-                raise ImportError(
-                    "To use templates you need to install Mako"
-                ) from e
-        return self.content, params
+            return parse(self.template().render(**params)), params
+        return self.sql, params
+
+    def template(self):
+        if Template is None:
+            raise ImportError("To use templates you need to install Mako")
+        if self.templates is None:
+            lookup = TemplateLookup(directories=self.sqldirs)
+            return Template(self.content, lookup=lookup)
+        return self.templates.get(self.content)
 
-    def execute(self, cursor, args, kwargs, prepare_params=None):
+    def statement(
+        self, cursor, args, kwargs, prepare_params=None, wrapper=None
+    ):
+        """Return the SQL string of the script and its parameters.
+
+        If ``wrapper`` is given, a format string like
+        ``'SELECT count(*) FROM ({}) AS q'``, the script is used as
+        its subquery. Returns ``None`` if the script can't be used as
+        subquery.
+        """
         if args:
-            content, params = self._prepare(cursor, args, prepare_params)
+            sql, params = self._prepare(cursor, args, prepare_params)
         else:
-            content, params = self._prepare(cursor, kwargs, prepare_params)
+            sql, params = self._prepare(cursor, kwargs, prepare_params)
+        if wrapper is not None:
+            subquery = sql.subquery()
+            if subquery is None:
+                return None
+            sql = parse(wrapper.format(subquery))
+        if not params:
+            # Without parameters a ? is no placeholder but an operator,
+            # e. g. PostgreSQL's jsonb operator.
+            return sql.content, params
+        # Rewrite the placeholders if the script was written
+        # for a driver with a different paramstyle.
+        return sql.render(cursor.paramstyle), params
+
+    def execute(self, cursor, args, kwargs, prepare_params=None, wrapper=None):
+        """Execute the script.
+
+        Returns ``False`` without executing anything if a ``wrapper``
+        is given and the script can't be used as subquery (see
+        :meth:`statement`).
+        """
+        statement = self.statement(
+            cursor, args, kwargs, prepare_params, wrapper
+        )
+        if statement is None:
+            return False
+        content, params = statement
         try:
             cursor.execute(content, params)
         finally:
             self.echo and self.mogrify(cursor, content, params)
+        return True
+
+    def many(self, cursor, params, page_size=1000, prepare_params=None):
+        """Execute the script once for every item of ``params``, an
+        iterable of dicts or sequences.
+
+        The items are sent in pages of ``page_size`` using the cursor's
+        ``executemany`` which the providers map to the fastest way their
+        driver offers. Templates are rendered for every item and
+        therefore executed one by one.
+        """
+        params = (payload(item) for item in params)
+        if self.is_template:
+            for item in params:
+                if isinstance(item, dict):
+                    self.execute(cursor, (), item, prepare_params)
+                else:
+                    self.execute(cursor, item, {}, prepare_params)
+            return
+
+        content = self.sql.render(cursor.paramstyle)
+        while True:
+            page = [
+                self._params(cursor, item, prepare_params)
+                for item in islice(params, page_size)
+            ]
+            if not page:
+                return
+            try:
+                cursor.executemany(content, page)
+            finally:
+                self.echo and self.mogrify(cursor, content, page[0])
+
+    def fan_out(
+        self,
+        db,
+        params,
+        concurrency=4,
+        ordered=True,
+        return_exceptions=False,
+    ):
+        """Execute the script concurrently for every item of ``params``,
+        an iterable of dicts or sequences, and fetch the results.
+
+        Every item is executed in a thread of a pool of ``concurrency``
+        threads using its own cursor of ``db``, which can be a
+        :class:`quma.Database` or the result of calling it, e. g.
+        ``db(autocommit=True)``. Use a connection pool to reuse the
+        connections.
+
+        Every item is committed. Statements without a result, e. g.
+        ``DELETE``, return the number of affected rows instead of rows.
+
+        Returns a list of the results in the order of ``params``. If
+        ``ordered`` is ``False`` a generator is returned which yields
+        tuples of the index of the item and its result as soon as they
+        are completed. If an item raises an error it is raised and the
+        pending items are cancelled. If ``return_exceptions`` is
+        ``True`` the error is returned as the item's result instead.
+        """
+        conn = getattr(db, "database", db).conn
+        if getattr(conn, "persist", False):
+            raise ValueError("Persistent connections can't be fanned out")
+        items = [payload(item) for item in params]
+
+        def run(item):
+            with db.cursor as cursor:
+                if isinstance(item, dict):
+                    query = self(cursor, **item).run()
+                else:
+                    query = self(cursor, *item).run()
+                if cursor.description is None:
+                    result = cursor.rowcount
+                else:
+                    result = query.all()
+                cursor.commit()
+                return result
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        futures = [executor.submit(run, item) for item in items]
+        if not ordered:
+            return completed(executor, futures, return_exceptions)
+        try:
+            return [outcome(future, return_exceptions) for future in futures]
+        finally:
+            shutdown(executor, futures)
 
 
 class CursorScript(object):
@@ -81,5 +381,13 @@ class CursorScript(object):
     def __call__(self, *args, **kwargs):
         return self.script(self.cursor, *args, **kwargs)
 
+    def many(self, params, page_size=1000, prepare_params=None):
+        return self.script.many(
+            self.cursor, params, page_size, prepare_params=prepare_params
+        )
+
+    def fan_out(self, params, **kwargs):
+        return self.script.fan_out(self.cursor.db, params, **kwargs)
+
     def __str__(self):
         return self.script.content
@@ -0,0 +1,274 @@
+import re
+from functools import lru_cache
+
+# Maps the DBAPI paramstyles to the two placeholder families quma
+# translates between.
+FAMILIES = {
+    "qmark": "qmark",
+    "named": "qmark",
+    "format": "pyformat",
+    "pyformat": "pyformat",
+}
+
+# Parts of SQL strings which can't contain placeholders
+SKIP = r"""
+    (?P<skip>
+        --[^\n]*                                # line comment
+      | /\*.*?\*/                               # block comment
+      | (?<!\w)[eE]'(?:[^'\\]|\\.|'')*'         # escape string
+      | '(?:[^']|'')*'                          # string
+      | "(?:[^"]|"")*"                          # quoted identifier
+      | `[^`]*`                                 # MySQL identifier
+      | \$(?P<tag>[A-Za-z_]\w*|)\$.*?\$(?P=tag)\$  # dollar quoted string
+      | ::                                      # PostgreSQL cast
+      | %%                                      # escaped percent
+    )
+"""
+
+TOKEN = re.compile(
+    SKIP
+    + r"""
+  | %\((?P<pyname>[^)]+)\)s                     # %(name)s
+  | (?P<pypos>%s)                               # %s
+  | (?<![\w:]):(?P<name>[A-Za-z_]\w*)           # :name
+  | (?P<qmark>\?)(?!&|\|(?!\|))                  # ? but not ?& or ?|
+  | (?P<end>;)                                  # end of statement
+    """,
+    re.S | re.X,
+)
+
+KEYWORD = re.compile(r"(?:\s+|--[^\n]*\n|/\*.*?\*/)*([A-Za-z]+)", re.S)
+
+PARENS = re.compile(
+    SKIP
+    + r"""
+  | (?P<values>(?<!\w)VALUES\s*\()              # start of the VALUES row
+  | (?P<open>\()
+  | (?P<close>\))
+    """,
+    re.S | re.X | re.I,
+)
+
+
+class SQL(object):
+    """
+    The result of the analysis of a SQL string.
+
+    Placeholders in comments, string literals and quoted identifiers are
+    ignored. ``style`` is the placeholder family used in the string,
+    ``'pyformat'`` (``%s`` and ``%(name)s``), ``'qmark'`` (``?`` and
+    ``:name``) or ``None`` if there are no placeholders. ``params``
+    holds the names of the placeholders in order of their appearance
+    (``None`` for positional ones) and ``positions`` their start and
+    end offsets. ``keywords`` contains the upper-cased first keyword of
+    every statement and ``ends`` the offsets of the semicolons which
+    terminate them.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self._rendered = {}
+
+        found, self.ends = self._scan()
+        # If both families occur, e. g. PostgreSQL's jsonb operator ?
+        # in a pyformat script, pyformat wins.
+        if found["pyformat"]:
+            self.style = "pyformat"
+        elif found["qmark"]:
+            self.style = "qmark"
+        else:
+            self.style = None
+        placeholders = found[self.style] if self.style else []
+
+        self.params = [name for _, name in placeholders]
+        self.positions = [match.span() for match, _ in placeholders]
+        self.texts = []
+        start = 0
+        for begin, end in self.positions:
+            self.texts.append(content[start:begin])
+            start = end
+        self.texts.append(content[start:])
+
+        self.keywords = []
+        start = 0
+        for end in self.ends + [len(content)]:
+            match = KEYWORD.match(content, start, end)
+            if match:
+                self.keywords.append(match.group(1).upper())
+            start = end + 1
+
+    def _scan(self):
+        found = {"pyformat": [], "qmark": []}
+        ends = []
+        for match in TOKEN.finditer(self.content):
+            if match.group("skip") is not None:
+                continue
+            if match.group("end") is not None:
+                ends.append(match.start())
+            elif match.group("pyname") is not None:
+                found["pyformat"].append((match, match.group("pyname")))
+            elif match.group("pypos") is not None:
+                found["pyformat"].append((match, None))
+            elif match.group("name") is not None:
+                found["qmark"].append((match, match.group("name")))
+            else:
+                found["qmark"].append((match, None))
+        return found, ends
+
+    def _texts(self, family):
+        if family == self.style or self.style is None:
+            return self.texts
+        if family == "pyformat":
+            return [text.replace("%", "%%") for text in self.texts]
+        return [text.replace("%%", "%") for text in self.texts]
+
+    def _join(self, texts, placeholders):
+        parts = [texts[0]]
+        for placeholder, text in zip(placeholders, texts[1:]):
+            parts.append(placeholder)
+            parts.append(text)
+        return "".join(parts)
+
+    def render(self, paramstyle):
+        """Return the SQL string using the placeholders of ``paramstyle``.
+
+        Strings without placeholders or with placeholders of the
+        requested family are returned unchanged.
+        """
+        family = FAMILIES[paramstyle]
+        if self.style is None or self.style == family:
+            return self.content
+        try:
+            return self._rendered[family]
+        except KeyError:
+            pass
+
+        if family == "pyformat":
+            placeholders = [
+                "%s" if name is None else "%({})s".format(name)
+                for name in self.params
+            ]
+        else:
+            placeholders = [
+                "?" if name is None else ":" + name for name in self.params
+            ]
+        rendered = self._join(self._texts(family), placeholders)
+        self._rendered[family] = rendered
+        return rendered
+
+    def subquery(self):
+        """Return the SQL string without its terminating semicolon for
+        use as subquery, or ``None`` if it isn't a single ``SELECT`` or
+        ``VALUES`` statement.
+        """
+        if self.keywords not in (["SELECT"], ["VALUES"]):
+            return None
+        if self.ends:
+            return self.content[: self.ends[0]]
+        return self.content
+
+    def numbered(self, escape=True):
+        """Return the SQL string with PostgreSQL's numbered placeholders
+        (``$1``, ``$2`` ...) and the ``pyformat`` placeholders of the
+        arguments in the order of their numbers.
+
+        Literal percent signs are escaped like in ``pyformat`` strings
+        if ``escape`` is ``True``. Named placeholders occurring more than
+        once share a number. Returns ``None`` if positional and named
+        placeholders are mixed.
+        """
+        names = set(self.params)
+        if None in names:
+            if len(names) > 1:
+                return None
+            count = len(self.params)
+            placeholders = ["${}".format(i + 1) for i in range(count)]
+            args = ["%s"] * count
+        else:
+            numbers = {}
+            for name in self.params:
+                numbers.setdefault(name, len(numbers) + 1)
+            placeholders = ["${}".format(numbers[n]) for n in self.params]
+            args = ["%({})s".format(name) for name in numbers]
+        texts = self._texts("pyformat" if escape else "qmark")
+        return self._join(texts, placeholders), args
+
+    def positional(self):
+        """Return the SQL string using only ``%s`` placeholders or
+        ``None`` if positional and named placeholders are mixed. The
+        arguments can be built with :func:`arguments`."""
+        if None in self.params and any(self.params):
+            return None
+        placeholders = ["%s"] * len(self.params)
+        return self._join(self._texts("pyformat"), placeholders)
+
+    def values(self):
+        """Split a single ``INSERT ... VALUES`` statement with exactly one
+        row into the part before the row, the row including its
+        parentheses and the part after it.
+
+        Used to rewrite the statement into a multi-row ``INSERT``.
+        Returns ``None`` for all other statements and if there are
+        placeholders outside of the row.
+        """
+        if self.keywords != ["INSERT"]:
+            return None
+        start = None
+        depth = 0
+        for match in PARENS.finditer(self.content):
+            if match.group("skip") is not None:
+                continue
+            if start is None:
+                if match.group("values") is not None:
+                    start = match.end() - 1
+                    depth = 1
+                continue
+            depth += 1 if match.group("close") is None else -1
+            if depth == 0:
+                end = match.end()
+                rest = self.content[end:]
+                # Statements which already contain several rows
+                if rest.lstrip().startswith(","):
+                    return None
+                for begin, finish in self.positions:
+                    if begin < start or finish > end:
+                        return None
+                return self.content[:start], self.content[start:end], rest
+        return None
+
+
+@lru_cache(maxsize=1024)
+def parse(content):
+    """Return the (cached) :class:`SQL` analysis of ``content``."""
+    return SQL(content)
+
+
+def multirow(content, params):
+    """Rewrite a ``pyformat`` ``INSERT`` statement with a single
+    ``VALUES`` row into a multi-row ``INSERT`` of all parameter sets
+    in ``params``.
+
+    Returns the statement using ``%s`` placeholders and the flat list
+    of its arguments, or ``None`` if the statement can't be rewritten.
+    """
+    values = parse(content).values()
+    if values is None:
+        return None
+    prefix, row, rest = values
+    sql = parse(row)
+    template = sql.positional()
+    if template is None:
+        return None
+    args = []
+    for item in params:
+        args.extend(arguments(sql.params, item))
+    rows = ", ".join([template] * len(params))
+    return prefix + rows + rest, args
+
+
+def arguments(names, params):
+    """Return the values of ``params``, a dict or a sequence, in the
+    order of the placeholder ``names`` (see :attr:`SQL.params`)."""
+    if None in names:
+        return list(params)
+    return [params[name] for name in names]
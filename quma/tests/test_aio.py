@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from .. import (
+    aio,
+    exc,
+)
+from . import util
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_rowcount():
+    assert aio.rowcount("INSERT 0 5") == 5
+    assert aio.rowcount("SELECT 1") == 1
+    assert aio.rowcount("CREATE TABLE") == -1
+    assert aio.rowcount(None) == -1
+
+
+def test_cursor(dbfile, qmark_sqldirs):
+    async def main():
+        db = aio.Database(util.SQLITE_URI, qmark_sqldirs, changeling=True)
+        async with db.cursor as cur:
+            user = await cur.users.by_name(name="User 1").one()
+            assert user.email == "user.1@example.com"
+            assert await cur.users.by_name(name="User 1").value() == (
+                "user.1@example.com"
+            )
+            names = [row.name async for row in cur.users.all()]
+            assert len(names) == 7
+            query = cur.users.by_city(city="City B")
+            assert await query.count() == 2
+            assert (await query.first()).name == "User 3"
+            assert not await cur.users.by_city(city="Nowhere").exists()
+            with pytest.raises(exc.MultipleRowsError):
+                await cur.users.all().one()
+            with pytest.raises(exc.DoesNotExistError):
+                await cur.users.by_city(city="Nowhere").one()
+            await cur.users.remove(name="User 1")
+            assert len(await cur.users.all().all()) == 6
+            await cur.rollback()
+            assert await cur.query("SELECT count(*) FROM users").value() == 7
+        assert cur.raw_conn is None
+        await db.close()
+
+    run(main())
+
+
+def test_commit(dbfile, qmark_sqldirs):
+    async def main():
+        db = aio.Database(util.SQLITE_URI, qmark_sqldirs, contextcommit=True)
+        async with db.cursor as cur:
+            await cur.users.remove(name="User 1")
+        async with db(autocommit=True).cursor as cur:
+            await cur.users.remove(name="User 2")
+        rows = await db.execute("SELECT count(*) FROM users")
+        assert rows[0][0] == 5
+        await db.close()
+
+    run(main())
+
+
+def test_persist(qmark_sqldirs):
+    async def main():
+        db = aio.Database(util.SQLITE_MEMORY, qmark_sqldirs, persist=True)
+        await db.execute(util.CREATE_USERS)
+        await db.execute(util.INSERT_USERS)
+        async with db.cursor as cur:
+            assert await cur.users.all().count() == 7
+        await db.close()
+
+    run(main())
+
+
+def test_pool(dbfile, qmark_sqldirs):
+    # Created outside of the loop which uses it
+    uri = "sqlite+pool:///{}".format(util.SQLITE_FILE)
+    db = aio.Database(uri, qmark_sqldirs, size=2, overflow=1, timeout=0.1)
+
+    async def main():
+
+        async def count():
+            async with db.cursor as cur:
+                result = await cur.users.all().count()
+                await asyncio.sleep(0.01)
+                return result
+
+        assert await asyncio.gather(*[count() for _ in range(10)]) == [7] * 10
+        assert db.conn.checkedin == 2
+        assert db.conn.checkedout == 0
+
+        cursors = [await db.cursor.create_cursor() for _ in range(3)]
+        with pytest.raises(exc.TimeoutError):
+            await db.cursor.create_cursor()
+        # A timed out waiter doesn't take a slot
+        assert db.conn.checkedout == 3
+        await cursors.pop().close()
+        cursors.append(await db.cursor.create_cursor())
+        for cur in cursors:
+            await cur.close()
+        await db.close()
+        assert db.conn is None
+
+    run(main())
+
+
+def test_asyncpg_execute():
+    from unittest import mock
+
+    async def main():
+        driver = aio.AsyncpgDriver(None, {"changeling": True, "ssl": False})
+        assert driver.kwargs == {"ssl": False}
+        conn = aio.AsyncpgConnection(mock.AsyncMock())
+        conn.raw.transaction = mock.Mock(return_value=mock.AsyncMock())
+        conn.raw.fetch.return_value = [("row",)]
+
+        content = "SELECT %(a)s, %(b)s, %(a)s, '5%%'"
+        result = await driver.execute(conn, content, {"b": 2, "a": 1})
+        assert result == ([("row",)], 1)
+        conn.raw.fetch.assert_called_once_with("SELECT $1, $2, $1, '5%'", 1, 2)
+        conn.raw.prepare.assert_not_called()
+        assert conn.transaction is not None
+        await driver.commit(conn)
+        assert conn.transaction is None
+
+        # Statements without a result report their status
+        conn.raw.execute.return_value = "UPDATE 3"
+        result = await driver.execute(conn, "UPDATE t SET a = %s", [1])
+        assert result == ([], 3)
+        conn.raw.execute.assert_called_once_with("UPDATE t SET a = $1", 1)
+        content = "UPDATE t SET a = %s RETURNING a"
+        result = await driver.execute(conn, content, [1])
+        assert result == ([("row",)], 1)
+        await driver.rollback(conn)
+
+        conn.autocommit = True
+        conn.raw.execute.return_value = "CREATE TABLE"
+        content = "CREATE TABLE t (a int); DROP TABLE t"
+        result = await driver.execute(conn, content, None)
+        assert result == ([], -1)
+        assert conn.transaction is None
+
+    run(main())
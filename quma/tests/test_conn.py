@@ -1,6 +1,7 @@
 import queue
 import sqlite3
 import threading
+import time
 from unittest.mock import Mock
 
 import pytest
@@ -60,10 +61,62 @@ def test_persistent_pessimistic(dbpess):
         assert cn is cursor.raw_conn
     dbpess.conn._check = Mock()
     dbpess.conn._check.side_effect = exc.OperationalError
+    # Connections returned a moment ago are not checked
+    with dbpess.cursor as cursor:
+        assert cn is cursor.raw_conn
+    dbpess.conn.returned -= dbpess.conn.query_interval
     with dbpess.cursor as cursor:
         assert cn is not cursor.raw_conn
 
 
+def test_verify():
+    conn = connect(util.SQLITE_MEMORY, persist=True, pessimistic=True)
+    assert conn.check_rate == 0.0
+    cn = conn.get()
+    conn.verify(cn, 0.1)
+    conn.verify(cn, 1)
+    conn.verify(cn, 60)
+    conn.verify(cn)
+    # get() checked the connection too
+    assert conn.checks == {"skipped": 2, "pinged": 1, "queried": 2}
+    assert conn.check_rate == 0.6
+    cn.close()
+    conn.verify(cn, 0)
+    with pytest.raises(exc.OperationalError):
+        conn.verify(cn, 1)
+    with pytest.raises(exc.OperationalError):
+        conn.verify(cn, 60)
+
+
+def test_reset():
+    from ..provider.sqlite import Connection
+
+    conn = connect(util.SQLITE_POOL_URI)
+    raw = Mock(spec=sqlite3.Connection)
+    raw.in_transaction = False
+    raw.isolation_level = "DEFERRED"
+    conn.put(raw)
+    raw.rollback.assert_not_called()
+    raw = conn.get(autocommit=True)
+    assert raw.isolation_level is None
+    raw.in_transaction = True
+    conn.put(raw)
+    raw.rollback.assert_called_once_with()
+    assert raw.isolation_level == "DEFERRED"
+    assert isinstance(conn._conn, Connection)
+    conn.close()
+
+    cn = conn.get()
+    cn.execute("SELECT 1")
+    assert not cn.in_transaction
+    cn.execute("CREATE TEMP TABLE t (a INTEGER)")
+    cn.execute("INSERT INTO t VALUES (1)")
+    assert cn.in_transaction
+    conn.put(cn)
+    assert not cn.in_transaction
+    conn.close()
+
+
 def pool_overflow_counting(uri):
     conn = connect(uri, size=1, overflow=4)
     cn1 = conn.get()
@@ -97,6 +150,107 @@ def test_mysql_pool_overflow_counting():
     pool_overflow_counting(util.MYSQL_POOL_URI)
 
 
+def pool_min_idle(uri, **kwargs):
+    from .test_db import wait_for
+
+    conn = connect(uri, size=3, min_idle=2, prewarm=True, **kwargs)
+    assert conn.checkedin == 2
+    cn1 = conn.get()
+    cn2 = conn.get()
+    # Only up to size connections are opened to keep min_idle
+    assert wait_for(lambda: conn.checkedin == 1)
+    assert conn.overflow == 0
+    conn.put(cn1)
+    conn.put(cn2)
+    assert conn.checkedin == 3
+    conn.close()
+    assert conn._maintainer is None
+
+    conn = connect(uri, size=3, min_idle=1, prewarm=True, **kwargs)
+    conn.prewarm(2)
+    assert conn.checkedin == 3
+    # The maintainer is only woken up if connections are missing
+    cn1 = conn.get()
+    assert not conn._maintainer._wakeup.is_set()
+    conn.put(cn1)
+    conn.close()
+
+    conn = connect(uri, size=2, prewarm="background", **kwargs)
+    assert wait_for(lambda: conn.checkedin == 2)
+    assert conn._maintainer is None
+    conn.close()
+
+
+def test_sqlite_pool_min_idle():
+    pool_min_idle(util.SQLITE_POOL_URI, check_same_thread=False)
+
+
+@pytest.mark.postgres
+def test_postgres_pool_min_idle():
+    pool_min_idle(util.PGSQL_POOL_URI)
+
+
+@pytest.mark.mysql
+def test_mysql_pool_min_idle():
+    pool_min_idle(util.MYSQL_POOL_URI)
+
+
+def pool_recycling(uri, **kwargs):
+    from .test_db import wait_for
+
+    conn = connect(uri, size=2, max_lifetime=0.2, **kwargs)
+    cn1 = conn.get()
+    cn2 = conn.get()
+    conn.put(cn2)
+    time.sleep(0.25)
+    # Expired connections are closed when they are returned ...
+    conn.put(cn1)
+    # ... or by the reaper while they are idle
+    assert wait_for(lambda: conn.recycled["lifetime"] == 2)
+    assert conn.checkedin == 0
+    assert conn.overflow == -2
+    conn.close()
+
+    conn = connect(uri, size=3, min_idle=1, idle_timeout=0.2, **kwargs)
+    cns = [conn.get() for _ in range(3)]
+    for cn in cns:
+        conn.put(cn)
+    # Idle connections are closed down to min_idle
+    assert wait_for(lambda: conn.recycled["idle"] >= 2)
+    assert wait_for(lambda: conn.checkedin == 1)
+    time.sleep(0.25)
+    assert conn.checkedin == 1
+    assert conn.recycled["lifetime"] == 0
+    conn.close()
+
+    conn = connect(uri, size=2, max_lifetime=100, **kwargs)
+    cn1 = conn.get()
+    conn.put(cn1)
+    # An expired idle connection is replaced in the slot of the thread
+    conn._expires[id(cn1)] = 0
+    cn2 = conn.get()
+    assert cn2 is not cn1
+    assert conn.recycled["lifetime"] == 1
+    assert conn.overflow == -1
+    conn.put(cn2)
+    assert conn.checkedin == 1
+    conn.close()
+
+
+def test_sqlite_pool_recycling():
+    pool_recycling(util.SQLITE_POOL_URI, check_same_thread=False)
+
+
+@pytest.mark.postgres
+def test_postgres_pool_recycling():
+    pool_recycling(util.PGSQL_POOL_URI)
+
+
+@pytest.mark.mysql
+def test_mysql_pool_recycling():
+    pool_recycling(util.MYSQL_POOL_URI)
+
+
 def non_persistent(uri, connection, pessimistic):
     conn = connect(uri, pessimistic=pessimistic)
     cn1 = conn.get()
@@ -214,7 +368,18 @@ def pessimistic_failure(uri):
     c1 = conn.get()
     conn.put(c1)
     c2 = conn.get()
-    assert c1 != c2
+    # Connections returned a moment ago are not checked
+    assert c1 == c2
+    assert conn.checks["skipped"] == 2
+    conn.put(c2)
+    conn._returned[id(c2)] -= conn._conn.query_interval
+    c3 = conn.get()
+    assert c2 != c3
+    assert conn.checks["queried"] == 1
+
+
+def test_sqlite_pessimistic_failure():
+    pessimistic_failure(util.SQLITE_POOL_URI)
 
 
 @pytest.mark.postgres
@@ -309,6 +474,85 @@ def test_mysql_infinite_pool():
     infinite_pool(util.MYSQL_POOL_URI)
 
 
+def pool_order(uri, **kwargs):
+    for use_lifo, expected in ((False, 0), (True, 1)):
+        conn = connect(uri, use_lifo=use_lifo, **kwargs)
+        cns = [conn.get(), conn.get()]
+        conn.put(cns[0])
+        conn.put(cns[1])
+        assert conn.get() is cns[expected]
+        conn.close()
+
+
+def test_sqlite_pool_order():
+    pool_order(util.SQLITE_POOL_URI)
+
+
+@pytest.mark.postgres
+def test_postgres_pool_order():
+    pool_order(util.PGSQL_POOL_URI)
+
+
+@pytest.mark.mysql
+def test_mysql_pool_order():
+    pool_order(util.MYSQL_POOL_URI)
+
+
+def pool_fairness(uri, **kwargs):
+    from .test_db import wait_for
+
+    conn = connect(uri, size=1, overflow=0, timeout=5, **kwargs)
+    first = conn.get()
+    served = queue.Queue()
+
+    def use(name):
+        cn = conn.get()
+        served.put(name)
+        conn.put(cn)
+
+    threads = []
+    for name in range(3):
+        t = threading.Thread(target=use, args=(name,))
+        t.start()
+        threads.append(t)
+        # Let the threads queue up one after another
+        assert wait_for(lambda n=name + 1: len(conn._waiters) == n)
+    conn.put(first)
+    for t in threads:
+        t.join()
+    # Waiting threads are served in the order of their arrival
+    assert [served.get() for _ in range(3)] == [0, 1, 2]
+    assert conn.checkedin == 1
+    assert conn.overflow == 0
+
+    # A connection which fails to reset gives up its slot
+    cn = conn.get()
+    reset = conn._conn.reset
+    conn._conn.reset = Mock(side_effect=RuntimeError("reset"))
+    with pytest.raises(RuntimeError):
+        conn.put(cn)
+    conn._conn.reset = reset
+    assert conn.checkedin == 0
+    assert conn.overflow == -1
+    # The slot can be used again right away
+    conn.put(conn.get())
+    conn.close()
+
+
+def test_sqlite_pool_fairness():
+    pool_fairness(util.SQLITE_POOL_URI, check_same_thread=False)
+
+
+@pytest.mark.postgres
+def test_postgres_pool_fairness():
+    pool_fairness(util.PGSQL_POOL_URI)
+
+
+@pytest.mark.mysql
+def test_mysql_pool_fairness():
+    pool_fairness(util.MYSQL_POOL_URI)
+
+
 def persistent_pool(uri, sqldirs):
     with pytest.raises(ValueError) as e:
         Database(uri, sqldirs, persist=True)
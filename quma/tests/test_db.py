@@ -1,6 +1,10 @@
+import os
+import shutil
 import sqlite3
 import sys
 import threading
+import time
+from array import array
 from unittest import mock
 
 import pytest
@@ -8,10 +12,16 @@ import pytest
 from .. import (
     Database,
     Namespace,
+    bundle,
+    cli,
     database,
+    exc,
     query,
+    registry,
     script,
+    watch,
 )
+from .. import columns as columns_
 from .. import cursor as cursor_
 from . import util
 
@@ -529,6 +539,59 @@ def test_template_script(db):
         script.Template = tmpl
 
 
+def test_template_cache(db, qmark_sqldirs, tmp_path):
+    with db.cursor as cursor:
+        db.user.by_name_tmpl(cursor, name="User 1").one()
+        assert len(db.templates.templates) == 1
+        tmpl = db.user.by_name_tmpl.template()
+        assert tmpl is db.user.by_name_tmpl.template()
+        assert db.templates.lookup is tmpl.lookup
+        q = cursor.query("SELECT ${value} AS v;", is_template=True, value=1)
+        assert q.value() == 1
+        assert len(db.templates.templates) == 2
+
+    changed = script.Script(
+        db.user.by_name_tmpl.content + "\n",
+        False,
+        True,
+        db.sqldirs,
+        templates=db.templates,
+    )
+    assert changed.template() is not tmpl
+    db.templates.clear()
+    assert len(db.templates.templates) == 0
+
+    # The least recently used templates are evicted
+    templates = script.TemplateCache(db.sqldirs, size=1)
+    first = templates.get("SELECT ${a};")
+    templates.get("SELECT ${b};")
+    assert len(templates.templates) == 1
+    assert templates.templates.evictions == 1
+    assert templates.get("SELECT ${a};") is not first
+
+    moddir = tmp_path / "modules"
+    dbmod = Database(
+        util.SQLITE_MEMORY,
+        qmark_sqldirs,
+        persist=True,
+        changeling=True,
+        template_module_dir=str(moddir),
+    )
+    dbmod.execute(util.CREATE_USERS)
+    dbmod.execute(util.INSERT_USERS)
+    with dbmod.cursor as cursor:
+        user = dbmod.user.by_name_tmpl(cursor, name="User 1").one()
+        assert user.intro == "I'm User 1"
+    assert len(list(moddir.glob("*.py"))) == 1
+    dbmod.templates.clear()
+    with dbmod.cursor as cursor:
+        user = dbmod.user.by_name_tmpl(cursor, name="User 2").one()
+        assert user.intro == "I'm not User 1"
+    assert len(list(moddir.glob("*.py"))) == 1
+    assert len(list(moddir.glob("*.msql"))) == 1
+    assert not list(moddir.glob("*.tmp"))
+
+
 def test_dict_callback(dbdictcb, carrier):
     db = dbdictcb
 
@@ -714,6 +777,10 @@ def query_cache(db):
         assert users._has_been_executed is True
         assert users._result_cache is None
         assert users.first() is not None
+        # first() reads only a single row
+        assert users._result_cache is None
+        assert len(users._head) == 1
+        assert len(users.all()) == 7
         assert users._result_cache is not None
 
 
@@ -793,6 +860,34 @@ def test_shadowing(db, dbshadow):
         assert db.get_city(cursor).one().name == "Shadowed City"
         assert db.addresses.by_zip(cursor).one().address == "Shadowed Address"
 
+    shadowing(dbshadow)
+
+
+def test_shadowing_resolved(qmark_shadow_sqldirs):
+    db = Database(
+        util.SQLITE_MEMORY,
+        qmark_shadow_sqldirs,
+        persist=True,
+        changeling=True,
+        cache=True,
+    )
+    db.execute(util.CREATE_USERS)
+    db.execute(util.INSERT_USERS)
+    shadowing(db)
+
+    root = db.namespaces["__root__"]
+    assert root._resolved["get_users"] is root.shadow._scripts["get_users"]
+    assert root._resolved["get_shadowed_test"].__self__ is root.shadow
+    assert "get_test" in root._resolved
+    assert db.root.get_test(None) == "Masking Test"
+    assert db.addresses.by_user is db.addresses.shadow.by_user
+    with pytest.raises(AttributeError):
+        db.addresses.nonexistent
+    with pytest.raises(AttributeError):
+        db.nonexistent
+
+
+def shadowing(dbshadow):
     with dbshadow.cursor as cursor:
         # root script from shadowed dir
         assert len(dbshadow.get_users(cursor)) == 7
@@ -839,6 +934,285 @@ def test_caching(db, dbcache):
         assert len(cursor.user._scripts) >= 0
 
 
+def test_caching_shadowed(qmark_shadow_sqldirs):
+    db = Database(util.SQLITE_MEMORY, qmark_shadow_sqldirs, cache=True)
+    assert "by_zip" in db.addresses._scripts
+    assert "_get_test" not in db.root._scripts
+    assert db.root.get_test(None) == "Masking Test"
+
+
+def wait_for(condition, timeout=5):
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:  # pragma: no-cover
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watch(qmark_sqldirs, tmp_path, use_inotify):
+    sqldir = tmp_path / "scripts"
+    shutil.copytree(str(qmark_sqldirs), str(sqldir))
+
+    with pytest.raises(ValueError) as e:
+        Database(util.SQLITE_MEMORY, sqldir, watch=True)
+    assert str(e.value).startswith("Watching scripts requires")
+
+    with mock.patch.object(
+        watch, "inotify", watch.inotify if use_inotify else lambda d: None
+    ):
+        db = Database(
+            util.SQLITE_MEMORY,
+            sqldir,
+            persist=True,
+            cache=True,
+            watch=True,
+            watch_interval=0.02,
+        )
+    if not use_inotify:
+        assert not db.watcher.uses_inotify
+    users = db.users
+    assert str(users.all).startswith("SELECT id, name, email")
+    by_name = users.by_name
+    assert len(db.watcher.namespaces) == len(db.namespaces)
+
+    time.sleep(0.05)
+    (sqldir / "users" / "all.sql").write_text("SELECT 1;")
+    (sqldir / "users" / "new.sql").write_text("SELECT 2;")
+    (sqldir / "users" / "by_city.sql").unlink()
+    assert wait_for(lambda: str(users.all) == "SELECT 1;")
+    assert wait_for(lambda: "by_city" not in users._scripts)
+    assert str(users.new) == "SELECT 2;"
+    with pytest.raises(AttributeError):
+        users.by_city
+    # unchanged scripts are not read again
+    assert users.by_name is by_name
+    assert db.watcher.reloads >= 1
+    # Changes within the resolution of the mtime are found by the size
+    sqlfile = sqldir / "users" / "new.sql"
+    stat = sqlfile.stat()
+    sqlfile.write_text("SELECT 22;")
+    os.utime(str(sqlfile), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert wait_for(lambda: str(users.new) == "SELECT 22;")
+    db.close()
+    assert db.watcher is None
+
+
+def test_missing_scripts(qmark_shadow_sqldirs, tmp_path):
+    sqldir = tmp_path / "scripts"
+    shutil.copytree(str(qmark_shadow_sqldirs[1]), str(sqldir))
+    db = Database(util.SQLITE_MEMORY, [qmark_shadow_sqldirs[0], sqldir])
+    addresses = db.addresses
+
+    assert str(addresses.by_user).startswith("SELECT")
+    assert "by_user" in addresses._missing[1]
+    assert "by_user" not in addresses.shadow._missing[1]
+    with pytest.raises(AttributeError):
+        addresses.nonexistent
+    assert "nonexistent" in addresses._missing[1]
+    assert "nonexistent" in addresses.shadow._missing[1]
+
+    with mock.patch.object(addresses, "_find_script") as find:
+        with pytest.raises(AttributeError):
+            addresses.nonexistent
+        assert str(addresses.by_user).startswith("SELECT")
+        assert find.call_count == 0
+
+    # A new file changes the mtime of the directory
+    time.sleep(0.01)
+    (sqldir / "addresses" / "by_user.sql").write_text("SELECT 1;")
+    assert str(addresses.by_user) == "SELECT 1;"
+    with pytest.raises(AttributeError):
+        addresses.nonexistent
+    assert addresses._missing[1] == {"nonexistent"}
+
+
+def test_lazy_caching(qmark_shadow_sqldirs):
+    db = Database(
+        util.SQLITE_MEMORY,
+        qmark_shadow_sqldirs,
+        persist=True,
+        changeling=True,
+        cache="lazy",
+        cache_size=2,
+    )
+    db.execute(util.CREATE_USERS)
+    db.execute(util.INSERT_USERS)
+    assert len(db.script_cache) == 0
+    assert len(db.user._scripts) == 0
+    with db.cursor as cursor:
+        user = cursor.user.by_name(name="User 1").one()
+        assert user.city == "City A"
+        assert len(db.script_cache) == 1
+        assert db.user.by_name is db.user.by_name
+        assert db.user.get_test(cursor) == "Test"
+        # namespace script from the shadowed dir
+        assert cursor.addresses.by_user().one().address == "Shadowed Address"
+        # masking namespace script
+        address = cursor.addresses.by_zip().one().address
+        assert address == "Masking Address"
+        with pytest.raises(AttributeError):
+            cursor.users.nonexistent
+
+    stats = db.script_cache.stats()
+    assert stats["scripts"] == 2
+    assert stats["hits"] == 2
+    assert stats["misses"] == 5
+    # Misses in the shadowing directory are cached as well
+    assert stats["evictions"] == 3
+
+    db = Database(util.SQLITE_MEMORY, qmark_shadow_sqldirs, cache="lazy")
+    by_user = db.addresses.by_user
+    assert db.script_cache.get((db.addresses.sqldir, "by_user")) is None
+    with mock.patch.object(Namespace, "_find_script") as find:
+        assert db.addresses.by_user is by_user
+        assert find.call_count == 0
+
+    db = Database(
+        util.SQLITE_MEMORY, qmark_shadow_sqldirs, cache="lazy", cache_bytes=1
+    )
+    db.users.all
+    db.users.by_name
+    assert len(db.script_cache) == 1
+    assert (db.users.sqldir, "by_name") in db.script_cache
+    content = db.users.by_name.content
+    assert db.script_cache.bytes == len(content.encode("utf-8"))
+    db.script_cache.remove((db.users.sqldir, "by_name"))
+    assert db.script_cache.bytes == 0
+    db.users.all
+    db.script_cache.clear()
+    assert len(db.script_cache) == 0
+    assert db.script_cache.bytes == 0
+
+
+def bundled_db(path):
+    db = Database(
+        util.SQLITE_MEMORY, bundle=path, persist=True, changeling=True
+    )
+    db.execute(util.CREATE_USERS)
+    db.execute(util.INSERT_USERS)
+    return db
+
+
+def test_bundle(qmark_shadow_sqldirs, tmp_path):
+    path = tmp_path / "scripts.qb"
+    cli.main(
+        ["bundle", "-o", str(path)] + [str(d) for d in qmark_shadow_sqldirs]
+    )
+
+    db = bundled_db(path)
+    assert db.sqldirs == [str(d) for d in qmark_shadow_sqldirs]
+    assert type(db.users).__module__ == "quma.mapping.users"
+    assert len(db.users._scripts) == 0
+    with db.cursor as cursor:
+        assert len(cursor.users.all()) == 7
+        assert len(db.users._scripts) == 1
+        assert cursor.user.get_test() == "Test"
+        assert cursor.get_test() == "Masking Test"
+        assert cursor.get_shadowed_test() == "Shadowed Test"
+        assert cursor.get_city().one().name == "Masking City"
+        assert len(cursor.get_trees()) == 2
+        assert cursor.addresses.by_user().one().address == "Shadowed Address"
+        assert cursor.addresses.by_zip().one().address == "Masking Address"
+        user = cursor.user.by_name_tmpl(name="User 1").one()
+        assert user.intro == "I'm User 1"
+        user = cursor.user.by_name_tmpl(name="User 2").one()
+        assert user.intro == "I'm not User 1"
+        with pytest.raises(AttributeError):
+            cursor.users.nonexistent
+    tmpl = db.user.by_name_tmpl.template()
+    assert type(tmpl) is bundle.ModuleTemplate
+    include = db.templates.lookup.get_template("users/include/macros.msql")
+    assert type(include) is bundle.ModuleTemplate
+
+    # Compiled templates of another Mako version are ignored
+    with mock.patch.object(bundle, "mako_magic", lambda: -1):
+        db = bundled_db(path)
+    with db.cursor as cursor:
+        user = cursor.user.by_name_tmpl(name="User 1").one()
+        assert user.intro == "I'm User 1"
+    assert type(db.user.by_name_tmpl.template()) is bundle.Template
+
+    with pytest.raises(ValueError) as e:
+        Database(util.SQLITE_MEMORY, bundle=path, cache=True, watch=True)
+    assert str(e.value).startswith("Bundled scripts")
+
+    # Directories are stored relative to the bundle
+    build = tmp_path / "build"
+    shutil.copytree(str(qmark_shadow_sqldirs[0]), str(build / "scripts"))
+    bundle.build(build / "scripts", build / "scripts.qb")
+    deploy = tmp_path / "deploy"
+    shutil.move(str(build), str(deploy))
+    db = bundled_db(deploy / "scripts.qb")
+    assert db.sqldirs == [str(deploy / "scripts")]
+    with db.cursor as cursor:
+        assert len(cursor.users.all()) == 7
+    db.close()
+    assert db.registry.bundle.data.closed
+
+    path.write_bytes(b"NOBUNDLE" + path.read_bytes()[8:])
+    with pytest.raises(ValueError) as e:
+        Database(util.SQLITE_MEMORY, bundle=path)
+    assert str(e.value).startswith("Not a quma bundle")
+
+
+def test_shared_registry(qmark_sqldirs):
+    db1 = Database(
+        util.SQLITE_MEMORY,
+        qmark_sqldirs,
+        shared=True,
+        cache=True,
+        persist=True,
+    )
+    db2 = Database(
+        util.SQLITE_MEMORY,
+        str(qmark_sqldirs),
+        shared=True,
+        cache=True,
+        persist=True,
+    )
+    db3 = Database(util.SQLITE_MEMORY, qmark_sqldirs, cache=True)
+    db4 = Database(
+        util.SQLITE_MEMORY, qmark_sqldirs, shared=True, cache=True, echo=True
+    )
+    assert db1.registry is db2.registry
+    assert db1.namespaces is db2.namespaces
+    assert db1.users is db2.users
+    assert db1.users.all is db2.users.all
+    assert db1.templates is db2.templates
+    assert db1.conn is not db2.conn
+    assert db1.registry is not db3.registry
+    assert db1.registry is not db4.registry
+    assert db1.users.db is db1.registry
+    assert db3.users.db is db3
+    assert db3.root.db.conn is db3.conn
+
+    for db in (db1, db2):
+        db.execute(util.CREATE_USERS)
+        db.execute(util.INSERT_USERS)
+        with db.cursor as cursor:
+            assert len(cursor.users.all()) == 7
+            assert cursor.user.get_test() == "Test"
+    with pytest.raises(ValueError) as e:
+        db1.register_namespace(qmark_sqldirs)
+    assert str(e.value).startswith("Namespaces can't be registered")
+    with pytest.raises(ValueError) as e:
+        Database(
+            util.SQLITE_MEMORY,
+            qmark_sqldirs,
+            shared=True,
+            prepare_params=lambda p: p,
+        )
+    assert str(e.value).startswith("Shared registries require")
+    db1.close()
+    assert db2.users.all is db1.registry.namespaces["users"].all
+    registry.clear()
+    db5 = Database(util.SQLITE_MEMORY, qmark_sqldirs, shared=True, cache=True)
+    assert db5.registry is not db2.registry
+    registry.clear()
+
+
 def test_close(db):
     from .. import provider
 
@@ -890,3 +1264,345 @@ def test_echo_parameter(dbecho):
         assert "SELECT name, email" in sql["sql"]
 
     sys.stdout = tmp
+
+
+def test_paramstyle_translation(pyformat_sqldirs):
+    # pyformat scripts run on SQLite which expects qmark placeholders
+    db = Database(util.SQLITE_MEMORY, pyformat_sqldirs, persist=True)
+    db.execute(util.CREATE_USERS)
+    db.execute(util.INSERT_USERS)
+    with db.cursor as cur:
+        assert cur.paramstyle == "qmark"
+        user = cur.users.by_name(name="User 3").one()
+        assert user[0] == "user.3@example.com"
+        user = cur.users.by_email("user.4@example.com", 1).one()
+        assert user[0] == "User 4"
+        assert len(cur.users.by_city(city="City C").all()) == 3
+        cur.users.add(
+            id=8, name="User 8", email="user.8@example.com", city="City D"
+        ).run()
+        assert cur.users.by_city(city="City D").value() == "User 8"
+        content = "SELECT name FROM users WHERE name LIKE '%%8' AND id = %s"
+        assert cur.query(content, 8).value() == "User 8"
+        script = db.users.by_name
+        assert script.sql is script.sql
+        assert script.sql.params == ["name"]
+    db.close()
+
+
+def test_count_without_fetch(db):
+    with db.cursor as cur:
+        statements = []
+        cur.raw_conn.set_trace_callback(statements.append)
+        query = cur.users.by_city(city="City C")
+        assert query.count() == 3
+        assert len(query) == 3
+        assert len(statements) == 1
+        assert statements[0].startswith("SELECT count(*) AS count FROM (")
+        assert len(query.all()) == 3
+        assert len(statements) == 2
+        query = cur.query("SELECT name FROM users;  -- comment")
+        assert query.count() == 7
+        query = cur.query("SELECT name FROM users WHERE id > ?", 4).run()
+        assert query.count() == 3
+        assert query.count() == 3
+        assert len(statements) == 4
+        # len() runs the query itself, so iterating doesn't run it again
+        query = cur.users.by_city(city="City C")
+        assert len(query) == 3
+        assert len(list(query)) == 3
+        assert len(statements) == 5
+        assert not statements[-1].startswith("SELECT count(*)")
+        # Providers without counting subqueries run the query itself
+        cur.raw_cursor.count_subquery = False
+        assert cur.users.by_city(city="City C").count() == 3
+        assert statements[-1].startswith("SELECT name, email")
+        cur.raw_conn.set_trace_callback(None)
+
+
+def test_exists_and_first_without_fetch(db):
+    with db.cursor as cur:
+        statements = []
+        cur.raw_conn.set_trace_callback(statements.append)
+        assert cur.users.by_city(city="City C").exists()
+        assert not cur.users.by_city(city="Nowhere").exists()
+        assert statements[-1].startswith("SELECT EXISTS (")
+        assert len(statements) == 2
+
+        users = cur.users.all()
+        assert users.first()[0] == 1
+        assert users.first()[0] == 1
+        assert users.exists()
+        assert len(statements) == 3
+        assert [user[0] for user in users] == [1, 2, 3, 4, 5, 6, 7]
+        assert cur.users.by_city(city="Nowhere").first() is None
+
+        users = cur.users.all().run()
+        assert users.exists()
+        assert len(users._head) == 1
+        assert len(users.all()) == 7
+        cur.raw_conn.set_trace_callback(None)
+
+
+def test_one_reads_two_rows_at_most(db):
+    with db.cursor as cur:
+        users = cur.users.all()
+        with pytest.raises(db.MultipleRowsError):
+            users.one()
+        assert len(users._head) == 2
+        assert users._result_cache is None
+        assert len(users.all()) == 7
+        with pytest.raises(db.MultipleRowsError):
+            users.one()
+
+        user = cur.users.by_name(name="User 2")
+        assert user.value() == "user.2@example.com"
+        assert len(user._head) == 1
+        with pytest.raises(db.DoesNotExistError):
+            cur.users.by_name(name="Nobody").one()
+
+
+def stream(db):
+    with db.cursor as cur:
+        users = cur.users.all()
+        names = []
+        for user in users.stream(size=2):
+            names.append(user[1])
+            # the cursor of the query is still usable
+            assert cur.users.by_city(city="City A").count() == 2
+        assert names == ["User {}".format(i) for i in range(1, 8)]
+        assert not users._has_been_executed
+        rows = list(cur.users.by_city(city="City B").stream())
+        assert [row[0] for row in rows] == ["User 3", "User 4"]
+        assert list(cur.users.by_city(city="Nowhere").stream()) == []
+
+
+def test_stream(db):
+    stream(db)
+
+
+def add_many(db, users):
+    with db.cursor as cur:
+        cur.users.add.many(users, page_size=10)
+        assert cur.users.by_city(city="Many City").count() == 25
+        # rows of other queries are accepted as parameters
+        rows = cur.users.by_city(city="City A").all()
+        db.users.remove.many(cur, rows)
+        assert cur.users.by_city(city="City A").count() == 0
+        cur.rollback()
+
+
+def test_add_many(db):
+    add_many(
+        db,
+        (
+            {
+                "name": "Many {}".format(i),
+                "email": "many{}@example.com".format(i),
+                "city": "Many City",
+            }
+            for i in range(25)
+        ),
+    )
+
+
+def test_many_pages():
+    cursor = mock.Mock(paramstyle="qmark", carrier=None)
+    tmpl = script.Script("SELECT :a", False, False, None)
+    tmpl.many(cursor, ({"a": i} for i in range(25)), page_size=10)
+    pages = [c.args for c in cursor.executemany.call_args_list]
+    assert [len(page) for _, page in pages] == [10, 10, 5]
+    assert pages[2] == ("SELECT :a", [{"a": i} for i in range(20, 25)])
+    cursor.reset_mock()
+    tmpl.many(cursor, [])
+    assert not cursor.executemany.called
+
+
+def test_columns(db):
+    with db.cursor as cur:
+        columns = cur.users.all().columns(size=3, numpy=False)
+        assert list(columns) == ["id", "name", "email", "city"]
+        assert columns["id"] == array("q", [1, 2, 3, 4, 5, 6, 7])
+        assert columns["name"][-1] == "User 7"
+
+        columns = cur.users.by_city(city="Nowhere").columns(numpy=False)
+        assert columns == {"name": [], "email": []}
+
+        batches = list(cur.users.all().column_batches(size=3, numpy=False))
+        assert [list(batch["id"]) for batch in batches] == [
+            [1, 2, 3],
+            [4, 5, 6],
+            [7],
+        ]
+
+        columns = cur.query("SELECT id * 1.5 AS f FROM users").columns()
+        if columns_.numpy is None:
+            assert columns["f"].typecode == "d"
+        else:
+            assert columns["f"].dtype == "float64"
+            assert columns["f"].sum() == 42.0
+
+
+def test_column_widening():
+    column = columns_.Column()
+    column.extend([1, 2])
+    column.extend([3.5])
+    assert column.data == array("d", [1, 2, 3.5])
+    column.extend([None])
+    assert column.data == [1.0, 2.0, 3.5, None]
+
+    column = columns_.Column()
+    column.extend([1, 2**70])
+    assert column.data == [1, 2**70]
+
+
+def test_arrow(db, tmpdir):
+    pyarrow = pytest.importorskip("pyarrow")
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    with db.cursor as cur:
+        reader = cur.users.all().to_arrow(batch_size=3)
+        assert reader.schema.names == ["id", "name", "email", "city"]
+        assert reader.schema.field("id").type == pyarrow.int64()
+        batches = list(reader)
+        assert [batch.num_rows for batch in batches] == [3, 3, 1]
+
+        table = cur.users.by_city(city="City C").to_arrow().read_all()
+        assert table.column("name").to_pylist() == [
+            "User 5",
+            "User 6",
+            "User 7",
+        ]
+        table = cur.users.by_city(city="Nowhere").to_arrow().read_all()
+        assert table.num_rows == 0
+        assert table.schema.names == ["name", "email"]
+
+        # Leading NULLs don't fix the type of a column to null
+        cur.execute("CREATE TEMP TABLE t (a INT, b REAL)")
+        cur.execute("INSERT INTO t VALUES (NULL, 1), (NULL, 2), (3, 2.5)")
+        query = cur.query("SELECT a, b FROM t ORDER BY b")
+        table = query.to_arrow(batch_size=2).read_all()
+        assert table.schema.field("a").type == pyarrow.int64()
+        assert table.column("a").to_pylist() == [None, None, 3]
+        assert table.column("b").to_pylist() == [1.0, 2.0, 2.5]
+
+        path = str(tmpdir / "users.parquet")
+        assert cur.users.all().write_arrow(path, batch_size=2) == 7
+        assert parquet.read_table(path).num_rows == 7
+        path = str(tmpdir / "users.arrow")
+        assert cur.users.all().write_arrow(path) == 7
+        with pyarrow.ipc.open_file(path) as f:
+            assert f.read_all().column("id").to_pylist()[-1] == 7
+        with pytest.raises(ValueError):
+            cur.users.all().write_arrow(path, format="csv")
+
+
+def batch(db):
+    with db.cursor as cur:
+        with cur.batch() as b:
+            users = b.add(cur.users.all())
+            city = b.add(cur.users.by_city(city="City B"))
+            user = b.add(db.users.by_name(cur, name="User 1"))
+            assert not users._has_been_executed
+        assert len(users) == 7
+        assert [row[0] for row in city] == ["User 3", "User 4"]
+        assert user.one()[0] == "user.1@example.com"
+        # statements without results
+        with cur.batch() as b:
+            b.add(cur.users.remove(name="User 1"))
+            b.add(cur.users.remove(name="User 2"))
+            remaining = b.add(cur.users.all())
+        assert len(remaining) == 5
+        cur.rollback()
+
+        with pytest.raises(ValueError):
+            with db.cursor as other:
+                cur.batch().add(other.users.all())
+        # nothing is executed if the context ends with an error
+        with pytest.raises(ZeroDivisionError):
+            with cur.batch() as b:
+                query = b.add(cur.users.all())
+                1 / 0
+        assert not query._has_been_executed
+
+
+def test_batch(db):
+    batch(db)
+
+
+def test_cursor_method_names(qmark_sqldirs, tmp_path):
+    sqldir = tmp_path / "scripts"
+    shutil.copytree(str(qmark_sqldirs), str(sqldir))
+    (sqldir / "batch").mkdir()
+    (sqldir / "batch" / "one.sql").write_text("SELECT 1 AS one;")
+    (sqldir / "copy_in.sql").write_text("SELECT 2 AS two;")
+    (sqldir / "streaming.sql").write_text("SELECT 3 AS three;")
+    db = Database(util.SQLITE_MEMORY, sqldir, persist=True)
+    db.execute(util.CREATE_USERS)
+    db.execute(util.INSERT_USERS)
+    with db.cursor as cur:
+        # Namespaces and root scripts take precedence over the methods
+        assert cur.batch.one().value() == 1
+        assert cur.copy_in().value() == 2
+        assert cur.streaming().value() == 3
+        with pytest.raises(exc.APIError):
+            cur.copy_out("SELECT 1", None)
+        # Streaming queries still use the cursor's method
+        assert len(list(cur.users.all().stream(size=2))) == 7
+    db.close()
+
+
+@pytest.mark.parametrize("cache", [False, True, "lazy"])
+def test_namespace_method_names(qmark_sqldirs, tmp_path, cache):
+    sqldir = tmp_path / "scripts"
+    shutil.copytree(str(qmark_sqldirs), str(sqldir))
+    (sqldir / "users" / "resolve.sql").write_text("SELECT 1 AS one;")
+    (sqldir / "users" / "reload.sql").write_text("SELECT 2 AS two;")
+    db = Database(util.SQLITE_MEMORY, sqldir, persist=True, cache=cache)
+    with db.cursor as cur:
+        # Internal methods of namespaces don't hide scripts
+        assert cur.users.resolve().value() == 1
+        assert cur.users.reload().value() == 2
+    db.close()
+
+
+def test_copy_unsupported(db):
+    with db.cursor as cur:
+        with pytest.raises(exc.APIError):
+            cur.copy_in("users", [])
+        with pytest.raises(exc.APIError):
+            cur.copy_out(cur.users.all(), sys.stdout)
+
+
+def fan_out(db):
+    cities = [{"city": "City A"}, {"city": "City B"}, {"city": "Nowhere"}]
+    results = db.users.by_city.fan_out(db, cities, concurrency=2)
+    assert [len(rows) for rows in results] == [2, 2, 0]
+    assert results[1][0][0] == "User 3"
+
+    results = db.users.by_city.fan_out(db(autocommit=True), cities)
+    assert [len(rows) for rows in results] == [2, 2, 0]
+
+    with db.cursor as cur:
+        results = cur.users.by_city.fan_out(cities, ordered=False)
+        results = sorted(results, key=lambda result: result[0])
+        assert [len(rows) for _, rows in results] == [2, 2, 0]
+
+    cities.append({"town": "City A"})
+    results = db.users.by_city.fan_out(db, cities, return_exceptions=True)
+    assert [len(rows) for rows in results[:3]] == [2, 2, 0]
+    assert isinstance(results[3], Exception)
+    with pytest.raises(type(results[3])):
+        db.users.by_city.fan_out(db, cities)
+
+    # Writes are committed and return the number of affected rows
+    names = [{"name": "User 1"}, {"name": "Nobody"}]
+    assert db.users.remove.fan_out(db, names) == [1, 0]
+    with db.cursor as cur:
+        assert len(cur.users.all()) == 6
+
+
+def test_fan_out(dbfile, db):
+    fan_out(dbfile)
+    with pytest.raises(ValueError):
+        db.users.by_city.fan_out(db, [{"city": "City A"}])
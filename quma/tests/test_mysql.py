@@ -60,6 +60,10 @@ def test_count(mydb, mypooldb):
     for db in (mydb, mypooldb):
         count(db)
         rowcount(db)
+        with db.cursor as cur:
+            # No counting subquery, which fails for duplicate columns
+            query = cur.query("SELECT * FROM users a JOIN users b USING (id)")
+            assert query.count() == 7
 
 
 @pytest.mark.mysql
@@ -283,3 +287,96 @@ def test_echo_parameter(mydb_echo, mypooldb_echo):
                 "'user.1@example.com' AND 1 = 1;\n"
             ) == sql["sql"]
     sys.stdout = tmp
+
+
+@pytest.mark.mysql
+def test_stream(mydb, mydb_dict):
+    for db in (mydb, mydb_dict):
+        with db.cursor as cur:
+            rows = list(cur.users.all().stream(size=2))
+            assert len(rows) == 7
+            assert cur.users.all().count() == 7
+
+
+@pytest.mark.mysql
+def test_add_many(mydb, mydb_dict):
+    from .test_db import add_many
+
+    for db in (mydb, mydb_dict):
+        add_many(
+            db,
+            (
+                {
+                    "id": 100 + i,
+                    "name": "Many {}".format(i),
+                    "email": "m{}@x.com".format(i),
+                    "city": "Many City",
+                }
+                for i in range(25)
+            ),
+        )
+
+
+@pytest.mark.mysql
+def test_batch(mydb, mydb_dict):
+    from .test_db import batch
+
+    for db in (mydb, mydb_dict):
+        batch(db)
+
+
+@pytest.mark.mysql
+def test_batch_sql():
+    from unittest.mock import Mock
+    from urllib.parse import urlparse
+
+    from ..provider.mysql import Connection
+
+    conn = Connection(urlparse(util.MYSQL_URI))
+    cursor = Mock()
+    cursor.nextset.side_effect = [True, None]
+    results = conn.execute_batch(
+        cursor,
+        [
+            ("SELECT %(a)s, '%%' -- c", {"a": 1}),
+            ("SELECT %s, %s;", [2, 3]),
+        ],
+    )
+    cursor.execute.assert_called_once_with(
+        "SELECT %s, '%%' -- c\n;\nSELECT %s, %s\n", [1, 2, 3]
+    )
+    assert len(results) == 2
+
+
+@pytest.mark.mysql
+def test_fan_out(mypooldb):
+    from .test_db import fan_out
+
+    fan_out(mypooldb)
+
+
+@pytest.mark.mysql
+def test_columns(mydb, mydb_dict):
+    for db in (mydb, mydb_dict):
+        with db.cursor as cur:
+            columns = cur.users.all().columns(size=2, numpy=False)
+            assert list(columns["id"]) == [1, 2, 3, 4, 5, 6, 7]
+            assert columns["city"][0] == "City A"
+
+
+@pytest.mark.mysql
+def test_arrow(mydb, mydb_dict):
+    pyarrow = pytest.importorskip("pyarrow")
+
+    for db in (mydb, mydb_dict):
+        with db.cursor as cur:
+            table = cur.users.all().to_arrow(batch_size=2).read_all()
+            assert table.schema.field("id").type == pyarrow.int64()
+            assert table.column("name").to_pylist()[0] == "User 1"
+            query = cur.query(
+                "SELECT CAST(255 AS UNSIGNED) AS big, "
+                "CAST(-1 AS SIGNED) AS small"
+            )
+            table = query.to_arrow().read_all()
+            assert table.schema.field("big").type == pyarrow.uint64()
+            assert table.schema.field("small").type == pyarrow.int64()
@@ -1,4 +1,8 @@
-from unittest.mock import Mock
+import io
+from unittest.mock import (
+    Mock,
+    call,
+)
 
 import pytest
 
@@ -328,3 +332,287 @@ def test_echo_parameter(pgdb_echo, pgpooldb_echo):
                 "'user.1@example.com' AND 1 = 1;\n"
             ) == sql["sql"]
     sys.stdout = tmp
+
+
+@pytest.mark.postgres
+def test_prepared_statements(pyformat_sqldirs):
+    from .. import Database
+
+    db = Database(util.PGSQL_URI, pyformat_sqldirs, persist=True, prepare=2)
+    with db.cursor as cur:
+        for i in range(1, 4):
+            user = cur.users.by_email("user.{}@example.com".format(i), 1)
+            assert user.value() == "User {}".format(i)
+        assert cur.users.by_name(name="User 1").value() == "user.1@example.com"
+        statements = cur.raw_conn.statements
+        assert statements.stats() == {
+            "statements": 2,
+            "hits": 2,
+            "misses": 2,
+            "evictions": 0,
+        }
+        cur.users.by_city(city="City A").all()
+        assert statements.evictions == 1
+        names = {
+            r[0] for r in cur.query("SELECT name FROM pg_prepared_statements")
+        }
+        assert names == set(statements.statements.values())
+
+        # Untyped parameters can't be prepared. The statement is executed
+        # unprepared and the transaction stays usable.
+        cur.users.add(
+            id=100, name="Prepared", email="p@example.com", city="P"
+        ).run()
+        assert cur.query("SELECT %s", 1).value() == 1
+        assert "SELECT %s" in statements.excluded
+        assert cur.query("SELECT %s", 1).value() == 1
+        assert cur.users.by_name(name="Prepared").value() == "p@example.com"
+
+        # Failing executions keep their statement
+        with pytest.raises(psycopg2.Error):
+            cur.query("SELECT 1 / %(a)s", a=0).value()
+        cur.rollback()
+        name = statements.statements["SELECT 1 / %(a)s"]
+        assert cur.query("SELECT 1 / %(a)s", a=1).value() == 1
+        assert statements.statements["SELECT 1 / %(a)s"] == name
+
+        cur.query("DEALLOCATE ALL").run()
+        assert len(statements) == 0
+        assert cur.users.by_name(name="User 1").value() == "user.1@example.com"
+    db.close()
+
+    # Reconnecting starts with an empty cache
+    db = Database(util.PGSQL_URI, pyformat_sqldirs, prepare=2)
+    with db.cursor as cur:
+        assert len(cur.raw_conn.statements) == 0
+
+
+@pytest.mark.postgres
+def test_prepared_statement_sql(pgdburl):
+    from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+    from ..cache import StatementCache
+
+    cn = Connection(pgdburl, prepare=1)
+    cursor = Mock()
+    cursor.name = None
+    cursor.connection.statements = StatementCache(1)
+    cursor.connection.autocommit = True
+    cursor.connection.get_transaction_status.return_value = (
+        TRANSACTION_STATUS_IDLE
+    )
+    execute = cn.get_cursor_attr(cursor, "execute")
+
+    content = "SELECT * FROM users WHERE name = %(name)s -- comment"
+    execute(content, {"name": "User 1"})
+    cursor.execute.assert_called_with(
+        "PREPARE quma_1 AS SELECT * FROM users WHERE name = $1 -- comment\n"
+        ";\nEXECUTE quma_1 (%(name)s)",
+        {"name": "User 1"},
+    )
+    execute(content, {"name": "User 1"})
+    cursor.execute.assert_called_with(
+        "EXECUTE quma_1 (%(name)s)", {"name": "User 1"}
+    )
+    execute("SELECT %s", [1])
+    cursor.execute.assert_called_with(
+        "DEALLOCATE quma_1;\nPREPARE quma_2 AS SELECT $1\n;\n"
+        "EXECUTE quma_2 (%s)",
+        [1],
+    )
+    execute("CREATE TABLE test (id int)", [])
+    cursor.execute.assert_called_with("CREATE TABLE test (id int)", [])
+
+    # Inside of transactions PREPARE is wrapped in a savepoint
+    cursor.connection.autocommit = False
+    execute("SELECT %s, 2", [1])
+    cursor.execute.assert_called_with(
+        "SAVEPOINT quma_prepare;\nDEALLOCATE quma_2;\n"
+        "PREPARE quma_3 AS SELECT $1, 2\n;\n"
+        "RELEASE SAVEPOINT quma_prepare;\nEXECUTE quma_3 (%s)",
+        [1],
+    )
+
+    # Statements PostgreSQL can't prepare are executed unprepared
+    class UndeterminedType(psycopg2.ProgrammingError):
+        pgcode = "42P18"
+
+    cursor.execute.side_effect = [UndeterminedType(), None, None]
+    execute("SELECT %s, 3", [1])
+    assert cursor.execute.call_args_list[-2:] == [
+        call(
+            "ROLLBACK TO SAVEPOINT quma_prepare;\n"
+            "RELEASE SAVEPOINT quma_prepare"
+        ),
+        call("SELECT %s, 3", [1]),
+    ]
+    assert "SELECT %s, 3" in cursor.connection.statements.excluded
+
+
+@pytest.mark.postgres
+def test_stream(pgdb, pgpooldb):
+    from .test_db import stream
+
+    for db in (pgdb, pgpooldb):
+        stream(db)
+    with pgdb(autocommit=True).cursor as cur:
+        rows = list(cur.users.all().stream(size=3))
+        assert [row.name for row in rows][-1] == "User 7"
+
+
+@pytest.mark.postgres
+def test_add_many(pgdb, pgpooldb):
+    from .test_db import add_many
+
+    for db in (pgdb, pgpooldb):
+        add_many(
+            db,
+            (
+                (
+                    100 + i,
+                    "Many {}".format(i),
+                    "m{}@x.com".format(i),
+                    "Many City",
+                )
+                for i in range(25)
+            ),
+        )
+
+
+@pytest.mark.postgres
+def test_executemany_sql(pgdburl):
+    conn = Connection(pgdburl)
+    cursor = Mock()
+    cursor.connection.encoding = "UTF8"
+    cursor.mogrify.side_effect = lambda template, args: template.encode()
+    insert = "INSERT INTO t VALUES (%(a)s, now()) ON CONFLICT DO NOTHING"
+    conn.executemany(cursor, insert, [{"a": 1}, {"a": 2}])
+    cursor.execute.assert_called_once_with(
+        b"INSERT INTO t VALUES (%(a)s, now()),(%(a)s, now()) "
+        b"ON CONFLICT DO NOTHING"
+    )
+    cursor.reset_mock()
+    conn.executemany(cursor, "DELETE FROM t WHERE a = %s", [[1], [2]])
+    assert cursor.execute.call_count == 1
+
+
+@pytest.mark.postgres
+def test_reset(pgdburl):
+    from psycopg2.extensions import (
+        TRANSACTION_STATUS_IDLE,
+        TRANSACTION_STATUS_INTRANS,
+    )
+
+    conn = Connection(pgdburl)
+    raw = Mock(autocommit=False)
+    raw.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+    conn.reset(raw)
+    raw.rollback.assert_not_called()
+    assert conn.enable_autocommit_if(True, raw).autocommit is True
+    raw.get_transaction_status.return_value = TRANSACTION_STATUS_INTRANS
+    conn.reset(raw)
+    raw.rollback.assert_called_once_with()
+    assert raw.autocommit is False
+
+
+@pytest.mark.postgres
+def test_copy(pgdb, pgpooldb):
+    for db in (pgdb, pgpooldb):
+        with db.cursor as cur:
+            rows = (
+                (100 + i, "Copy\t{}\\".format(i), "c@x.com", "Copy City")
+                for i in range(5)
+            )
+            assert cur.copy_in("users", rows) == 5
+            # changeling rows are read by column name
+            cur.execute("CREATE TABLE test (name text, id int, b bytea)")
+            rows = cur.users.all()
+            assert cur.copy_in("test", rows, columns=["name", "id"]) == 12
+
+            sink = io.StringIO()
+            query = cur.users.by_city(city="Copy City")
+            assert cur.copy_out(query, sink) == 5
+            assert sink.getvalue().splitlines()[0] == "Copy\\t0\\\\\tc@x.com"
+            sink = io.StringIO()
+            cur.copy_out(
+                "SELECT id, name FROM test WHERE id < 2 ORDER BY id",
+                sink,
+                options="FORMAT csv, HEADER",
+            )
+            assert sink.getvalue().splitlines() == ["id,name", "1,User 1"]
+            with pytest.raises(ValueError):
+                cur.copy_out(cur.users.remove, sink)
+            cur.rollback()
+
+
+@pytest.mark.postgres
+def test_copy_reader():
+    from ..provider.postgresql import CopyReader
+
+    rows = [(1, None, True, b"\x01", "a\nb"), {"b": 2, "a": 1}]
+    reader = CopyReader(iter(rows), columns=["a", "b"])
+    assert reader.read(1) == "1\t\\N\tt\t\\\\x01\ta\\nb\n"
+    assert reader.read() == "1\t2\n"
+    assert reader.read(1) == ""
+    with pytest.raises(ValueError) as e:
+        CopyReader([{"a": 1}]).read()
+    assert str(e.value) == "Copying mappings requires columns"
+
+
+@pytest.mark.postgres
+def test_batch(pgdb, pgpooldb):
+    from .test_db import batch
+
+    for db in (pgdb, pgpooldb):
+        batch(db)
+
+
+@pytest.mark.postgres
+def test_aio(pyformat_sqldirs):
+    import asyncio
+
+    from .. import aio
+
+    async def main():
+        for uri in (util.PGSQL_URI, util.PGSQL_POOL_URI):
+            db = aio.Database(uri, pyformat_sqldirs)
+            async with db.cursor as cur:
+                user = await cur.users.by_name(name="User 1").one()
+                assert user["email"] == "user.1@example.com"
+                assert len([row async for row in cur.users.all()]) == 7
+                assert await cur.users.remove(name="User 1").count() == 1
+                await cur.rollback()
+                assert await cur.users.all().count() == 7
+            await db.close()
+
+    asyncio.run(main())
+
+
+@pytest.mark.postgres
+def test_fan_out(pgpooldb):
+    from .test_db import fan_out
+
+    fan_out(pgpooldb)
+
+
+@pytest.mark.postgres
+def test_columns(pgdb, pgpooldb):
+    for db in (pgdb, pgpooldb):
+        with db.cursor as cur:
+            columns = cur.users.all().columns(size=2, numpy=False)
+            assert list(columns["id"]) == [1, 2, 3, 4, 5, 6, 7]
+            assert columns["city"][0] == "City A"
+
+
+@pytest.mark.postgres
+def test_arrow(pgdb, pgpooldb):
+    pyarrow = pytest.importorskip("pyarrow")
+
+    for db in (pgdb, pgpooldb):
+        with db.cursor as cur:
+            table = cur.users.all().to_arrow(batch_size=2).read_all()
+            assert table.schema.field("id").type == pyarrow.int32()
+            assert table.schema.field("name").type == pyarrow.string()
+            assert table.num_rows == 7
+            table = cur.users.by_city(city="Nowhere").to_arrow().read_all()
+            assert table.schema.field("name").type == pyarrow.string()
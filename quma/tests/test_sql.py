@@ -0,0 +1,157 @@
+import pytest
+
+from .. import sql
+
+
+def test_pyformat():
+    parsed = sql.SQL("SELECT * FROM t WHERE a = %(a)s AND b = %s")
+    assert parsed.style == "pyformat"
+    assert parsed.params == ["a", None]
+    assert parsed.positions == [(26, 31), (40, 42)]
+    assert parsed.render("pyformat") is parsed.content
+    assert parsed.render("qmark") == "SELECT * FROM t WHERE a = :a AND b = ?"
+    assert parsed.render("named") is parsed.render("qmark")
+
+
+def test_qmark():
+    parsed = sql.SQL("SELECT * FROM t WHERE a = :a AND b = ?")
+    assert parsed.style == "qmark"
+    assert parsed.params == ["a", None]
+    assert parsed.render("qmark") is parsed.content
+    assert parsed.render("format") == (
+        "SELECT * FROM t WHERE a = %(a)s AND b = %s"
+    )
+
+
+def test_no_params():
+    parsed = sql.SQL("SELECT 100 % 7")
+    assert parsed.style is None
+    assert parsed.params == []
+    assert parsed.render("pyformat") == "SELECT 100 % 7"
+    assert parsed.render("qmark") == "SELECT 100 % 7"
+
+
+def test_percent_signs():
+    parsed = sql.SQL("SELECT * FROM t WHERE a LIKE 'x%' AND b = ?")
+    assert parsed.render("pyformat") == (
+        "SELECT * FROM t WHERE a LIKE 'x%%' AND b = %s"
+    )
+    parsed = sql.SQL("SELECT * FROM t WHERE a LIKE 'x%%' AND b = %s")
+    assert parsed.render("qmark") == (
+        "SELECT * FROM t WHERE a LIKE 'x%' AND b = ?"
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "SELECT '?', ':a', 'it''s ?' FROM t",
+        "SELECT E'\\' ?' FROM t",
+        'SELECT "a?b", `c?d` FROM t',
+        "SELECT 1 -- ? :a\nFROM t",
+        "SELECT 1 /* ? :a\n %s */ FROM t",
+        "SELECT $$ ? $$, $tag$ :a $tag$ FROM t",
+        "SELECT a::text, b[lo:hi], '12:30' FROM t",
+    ],
+)
+def test_ignored(content):
+    parsed = sql.SQL(content)
+    assert parsed.style is None
+    assert parsed.render("pyformat") == content
+
+
+def test_mixed():
+    # The jsonb operator ? in a pyformat script is not a placeholder
+    parsed = sql.SQL("SELECT * FROM t WHERE d ? 'key' AND a = %s")
+    assert parsed.style == "pyformat"
+    assert parsed.params == [None]
+
+
+@pytest.mark.parametrize("operator", ["?", "?|", "?&"])
+def test_jsonb_operators(operator):
+    from unittest.mock import Mock
+
+    from ..script import Script
+
+    content = "SELECT * FROM t WHERE data {} 'key'".format(operator)
+    script = Script(content, False, False, [])
+    cursor = Mock(paramstyle="pyformat")
+    # Without parameters nothing is rewritten
+    assert script.statement(cursor, (), {}) == (content, {})
+    if operator != "?":
+        parsed = sql.SQL(content + " AND a = ?")
+        assert parsed.params == [None]
+        assert parsed.render("pyformat").endswith(
+            "data {} 'key' AND a = %s".format(operator)
+        )
+
+
+def test_parse_cache():
+    content = "SELECT * FROM t WHERE a = ?"
+    assert sql.parse(content) is sql.parse(content)
+
+
+def test_keywords():
+    assert sql.SQL("select 1").keywords == ["SELECT"]
+    assert sql.SQL("-- c\n/* ; */ SELECT ';'; ").keywords == ["SELECT"]
+    content = "INSERT INTO t VALUES (1);\nDISCARD ALL; -- done"
+    assert sql.SQL(content).keywords == ["INSERT", "DISCARD"]
+
+
+def test_numbered():
+    parsed = sql.SQL("SELECT %(a)s, %(b)s, %(a)s, '%%'")
+    assert parsed.numbered() == (
+        "SELECT $1, $2, $1, '%%'",
+        ["%(a)s", "%(b)s"],
+    )
+    parsed = sql.SQL("SELECT ?, ?, '%'")
+    assert parsed.numbered() == ("SELECT $1, $2, '%%'", ["%s", "%s"])
+    assert sql.SQL("SELECT 1").numbered() == ("SELECT 1", [])
+    assert sql.SQL("SELECT %s, %(a)s").numbered() is None
+
+
+def test_subquery():
+    assert sql.SQL("SELECT 1; -- c").subquery() == "SELECT 1"
+    assert sql.SQL("VALUES (1)").subquery() == "VALUES (1)"
+    assert sql.SQL("SELECT 1; SELECT 2").subquery() is None
+    assert sql.SQL("DELETE FROM t").subquery() is None
+
+
+def test_values():
+    content = (
+        "INSERT INTO t (a, b) VALUES (%(a)s, lower(%(b)s)) "
+        "ON CONFLICT DO NOTHING;"
+    )
+    assert sql.SQL(content).values() == (
+        "INSERT INTO t (a, b) VALUES ",
+        "(%(a)s, lower(%(b)s))",
+        " ON CONFLICT DO NOTHING;",
+    )
+    content = "INSERT INTO t -- values (\n values (?, ')')"
+    assert sql.SQL(content).values() == (
+        "INSERT INTO t -- values (\n values ",
+        "(?, ')')",
+        "",
+    )
+    assert sql.SQL("INSERT INTO t VALUES (1), (2)").values() is None
+    assert sql.SQL("INSERT INTO t SELECT * FROM s").values() is None
+    assert sql.SQL("SELECT * FROM (VALUES (1)) AS v").values() is None
+    content = (
+        "INSERT INTO t VALUES (%(a)s) ON CONFLICT (a) DO UPDATE SET b = %(b)s"
+    )
+    assert sql.SQL(content).values() is None
+
+
+def test_multirow():
+    content = "INSERT INTO t VALUES (%(a)s, %(b)s, '5%%') RETURNING a"
+    assert sql.multirow(content, [{"a": 1, "b": 2}, {"b": 4, "a": 3}]) == (
+        "INSERT INTO t VALUES (%s, %s, '5%%'), (%s, %s, '5%%') RETURNING a",
+        [1, 2, 3, 4],
+    )
+    content = "INSERT INTO t VALUES (%s, %s)"
+    assert sql.multirow(content, [[1, 2], [3, 4]]) == (
+        "INSERT INTO t VALUES (%s, %s), (%s, %s)",
+        [1, 2, 3, 4],
+    )
+    assert sql.multirow("INSERT INTO t VALUES (%s, %(a)s)", [[1]]) is None
+    assert sql.multirow("UPDATE t SET a = %s", [[1]]) is None
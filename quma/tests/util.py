@@ -7,6 +7,7 @@ DB_NAME = "quma_test_db"
 SQLITE_FILE = "/tmp/quma_test.sqlite"
 SQLITE_URI = "sqlite:///{}".format(SQLITE_FILE)
 SQLITE_MEMORY = "sqlite:///:memory:"
+SQLITE_POOL_URI = "sqlite+pool:///{}".format(SQLITE_FILE)
 
 PGSQL_USER = os.environ.get("QUMA_PGSQL_USER", DB_USER)
 PGSQL_PASS = os.environ.get("QUMA_PGSQL_PASS", DB_PASS)
@@ -0,0 +1,125 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import threading
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+IN_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+
+
+def inotify(dirs):
+    """Return an inotify file descriptor watching ``dirs`` or None
+    if inotify is not available on this platform."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for path in dirs:
+        if libc.inotify_add_watch(fd, os.fsencode(str(path)), IN_MASK) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+def collect_namespaces(namespaces):
+    """Return all namespace objects including shadowed ones.
+
+    Aliases are separate instances of the same namespace class,
+    so all of them have to be reloaded.
+    """
+    result = {}
+    for namespace in namespaces.values():
+        while namespace is not None:
+            result[id(namespace)] = namespace
+            namespace = namespace.shadow
+    return list(result.values())
+
+
+class Watcher(object):
+    """
+    Reloads the scripts of cached namespaces when files change.
+
+    Uses inotify on Linux and falls back to checking the modification
+    times of the script files every ``interval`` seconds. ``on_change``
+    is called after namespaces have been reloaded.
+    """
+
+    def __init__(self, namespaces, interval=1.0, on_change=None):
+        self.namespaces = collect_namespaces(namespaces)
+        self.interval = interval
+        self.on_change = on_change
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def start(self):
+        self._fd = inotify({ns.sqldir for ns in self.namespaces})
+        self._thread = threading.Thread(
+            target=self._run, name="quma-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def check(self):
+        """Reload all namespaces whose files have changed."""
+        changed = False
+        for namespace in self.namespaces:
+            if namespace._reload():
+                self.reloads += 1
+                changed = True
+        if changed and self.on_change:
+            self.on_change()
+
+    def _wait(self):
+        if self._fd is None:
+            return not self._stop.wait(self.interval)
+        ready, _, _ = select.select([self._fd], [], [], self.interval)
+        if not ready:
+            return False
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._wait() and not self._stop.is_set():
+                self.check()